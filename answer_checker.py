@@ -0,0 +1,274 @@
+import ast
+import operator
+import re
+from dataclasses import dataclass
+from fractions import Fraction
+from math import gcd
+from typing import Dict, List, Optional, Tuple
+
+# Units that may be written straight after a number ("1440m^2", "18 mm²") without making it an expression.
+_UNITS = {"m", "cm", "mm", "km", "ft", "in", "yd", "mi", "g", "kg", "lb", "lbs", "oz", "h", "hr", "min", "s"}
+# Answers that are not a single number: inequalities, truth values, "no solution", ...
+_NOT_NUMERIC = re.compile(r"[<>≤≥≯≮]|\b(?:greater|less|more than|fewer|between|true|false|yes|no solution|"
+                          r"not possible|infinitely|no)\b", re.IGNORECASE)
+# Questions that ask for a particular form, where the right value in another form is not the answer.
+_SIMPLIFY = re.compile(r"\b(?:simplify|simplest form|lowest terms|reduce)\b", re.IGNORECASE)
+_NEGATION = re.compile(r"\b(?:not|isn't|incorrect|wrong|mistake|almost|close)\b", re.IGNORECASE)
+# The tutor restating the student's answer rather than giving its own.
+_QUOTED = re.compile(r"\b(?:your (?:final )?answer|you (?:said|got|wrote|answered|found|have))\b", re.IGNORECASE)
+# Prose allowed around the number of an answer, e.g. "The slope is 1/3" or "28 boxes did not contain a prize".
+_MAX_WORDS = 6
+
+_FINAL_ANSWER = [
+    re.compile(r"\\boxed\{(.+?)\}"),
+    re.compile(r"(?:final answer|the answer|answer|solution|result)\s*(?:is|:|=|would be|will be)\s*(.+?)(?:(?<!\.)\.(?=\s|$)|[!\n]|$)",
+               re.IGNORECASE),
+]
+_WEAK_ANSWER = [
+    re.compile(r"\*\*([^*]+?)\*\*"),
+    re.compile(r"(?:^|\s)[a-zA-Z]\s*=\s*([^=\n]+?)(?:(?<!\.)\.(?=\s|$)|[!\n]|$)"),
+    re.compile(r"(?:^|[\s(])([^\s].{0,40}?)\s+is (?:correct|right)\b", re.IGNORECASE),
+]
+
+_OPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+              ast.Pow: operator.pow, ast.USub: operator.neg, ast.UAdd: operator.pos}
+
+@dataclass
+class Value:
+    """A parsed answer. tolerance is non-zero for values written as approximations ("0.0833...", "≈ 8.6")."""
+    value: Fraction
+    tolerance: Fraction = Fraction(0)
+    # Decimal places as written, counted in the units of value (so "8.33%" has 4), or None for exact forms.
+    decimals: Optional[int] = None
+    percent: bool = False
+    # The number as written, e.g. "3/9" or "0.3", to tell forms of the same value apart.
+    written: str = ""
+
+    def reduced(self) -> bool:
+        """False if a fraction in the written form is not in lowest terms ("3/9")."""
+        return all(gcd(int(a), int(b)) == 1 for a, b in re.findall(r"(\d+)\s*/\s*(\d+)", self.written))
+
+def _evaluate(node) -> Fraction:
+    if isinstance(node, ast.Expression):
+        return _evaluate(node.body)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return Fraction(str(node.value))
+    if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+        left, right = _evaluate(node.left), _evaluate(node.right)
+        if isinstance(node.op, ast.Pow) and (right.denominator != 1 or abs(right) > 100):
+            raise ValueError("unsupported exponent")
+        return _OPERATORS[type(node.op)](left, right)
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _OPERATORS:
+        return _OPERATORS[type(node.op)](_evaluate(node.operand))
+    raise ValueError("not a number")
+
+def _latex(text: str) -> str:
+    text = re.sub(r"\\[dt]?frac\{([^{}]+)\}\{([^{}]+)\}", r"(\1)/(\2)", text)
+    text = re.sub(r"\\(?:left|right|displaystyle|,|!|;)", "", text)
+    text = text.replace(r"\times", "*").replace(r"\cdot", "*").replace(r"\div", "/").replace(r"\%", "%")
+    return text.replace("$", "") if "\\" in text else text
+
+def parse_value(text: str) -> Optional[Value]:
+    """
+    Parse one written answer such as "1/12", ".0833...", "8.333...%", "$287.50", "3 5/8", "940 pounds"
+    or "-2 + 4" into a Value. Returns None if it is not a single number.
+    """
+    text = _latex(text).strip().strip("*`").strip()
+    # Repeating-decimal marks first, so stripping the trailing full stop below can't eat them.
+    approximate = bool(re.search(r"\.\.\.|…|\brepeating\b|\brecurring\b", text, re.IGNORECASE))
+    text = text.replace("...", "").replace("…", "")
+    text = re.sub(r"\(?\b(?:repeating|recurring)\b\)?", "", text, flags=re.IGNORECASE).strip()
+    text = re.sub(r"\\\(|\\\)|\\\[|\\\]", "", text).rstrip(".!").strip()
+    approximate |= bool(re.match(r"^(?:about|approximately|around|roughly|≈|~)\s*", text, re.IGNORECASE))
+    text = re.sub(r"^(?:about|approximately|around|roughly|≈|~)\s*", "", text, flags=re.IGNORECASE)
+    text = re.sub(r"(?<=\d),(?=\d{3}\b)", "", text)
+    percent = bool(re.search(r"\d\s*(?:%|percent\b)", text))
+    text = re.sub(r"\s*(?:%|percent\b)", " ", text).replace("$", "").replace("°", " ")
+    text = text.replace("−", "-").replace("×", "*").replace("·", "*").replace("÷", "/").replace("^", "**")
+    text = text.replace("²", "**2").replace("³", "**3")
+    # Strip units glued to the number ("1440m**2", "18 mm**2") and prose words around it.
+    text = re.sub(r"(?<=[\d)\s])([a-z]+)(?:\*\*[23])?(?=\s*$|\s+[A-Za-z])",
+                  lambda m: " " if m.group(1) in _UNITS else m.group(0), text)
+    words = re.findall(r"[A-Za-z][A-Za-z']*", text)
+    if len(words) > _MAX_WORDS:
+        return None
+    match = re.fullmatch(r"\s*(?:[A-Za-z][A-Za-z' ]*?(?:\bis|\bare|\bof|\bin|\bequals|\bbe|:)\s+)?"
+                         r"([-+*/().\d\s]*\d[-+*/().\d\s]*?)(?:\s+[A-Za-z][A-Za-z' ]*)?\s*", text)
+    if match is None:
+        return None
+    expression = as_written = match.group(1).strip()
+    expression = re.sub(r"(\d+)\s+(\d+)/(\d+)", r"(\1+\2/\3)", expression)
+    expression = re.sub(r"\)\s*\(", ")*(", expression)
+    expression = re.sub(r"(\d)\s*\(", r"\1*(", expression)
+    expression = re.sub(r"\)\s*(\d)", r")*\1", expression)
+    if re.search(r"\d\s+\d", expression):
+        return None
+    try:
+        value = _evaluate(ast.parse(expression, mode="eval"))
+    except (SyntaxError, ValueError, ZeroDivisionError, TypeError, OverflowError, RecursionError, MemoryError):
+        return None
+    decimals = None
+    written = re.fullmatch(r"[-+]?\d*\.(\d+)", expression)
+    if written:
+        decimals = len(written.group(1))
+    tolerance = Fraction(1, 10 ** decimals) if approximate and decimals else Fraction(0)
+    if approximate and decimals is None and value.denominator == 1:
+        tolerance = Fraction(1, 2)
+    if percent:
+        value /= 100
+        tolerance /= 100
+        decimals = decimals + 2 if decimals is not None else None
+    return Value(value, tolerance, decimals, percent, as_written)
+
+def _rounds_to(exact: Fraction, shown: Value) -> bool:
+    """True if shown is exact rounded (half up) to the decimal places shown, with at least two places."""
+    if shown.decimals is None or shown.decimals < 2:
+        return False
+    scale = 10 ** shown.decimals
+    if (exact * scale).denominator == 1:
+        return False
+    sign = -1 if exact < 0 else 1
+    return sign * Fraction(int(abs(exact) * scale + Fraction(1, 2)), scale) == shown.value
+
+def equivalent(a: Value, b: Value) -> bool:
+    """True if two written answers denote the same number, allowing for repeating decimals and rounding."""
+    if abs(a.value - b.value) <= a.tolerance + b.tolerance:
+        return True
+    if _rounds_to(a.value, b) or _rounds_to(b.value, a):
+        return True
+    # "35" for an expected "35%" (or the other way round).
+    if a.percent != b.percent:
+        percent, plain = (a, b) if a.percent else (b, a)
+        return abs(percent.value * 100 - plain.value) <= (percent.tolerance * 100 + plain.tolerance)
+    return False
+
+# Between alternative forms or parts of an answer: ";", " or ", and commas outside parentheses and numbers.
+_SEPARATOR = re.compile(r";|,(?!\d{3}\b)(?![^()]*\))|\bor\b")
+# "Mean", "P(red then gray)", "f(-2.5)": the name in front of "= value".
+_LABEL = re.compile(r"^\s*(?:[A-Za-z][A-Za-z ]*(?:\([^()]*\))?)?\s*$")
+
+def _parts(answer: str) -> List[Tuple[List[str], bool]]:
+    """
+    Split "a; b" / "a, b" / "a or b" into parts, and each part "label = expr = value" into its pieces.
+
+    Returns (pieces, labelled) per part; a labelled part such as "Area = (1/2)(b₁ + b₂)h = 18" may have
+    working in between that does not evaluate to a number.
+    """
+    parts = []
+    for part in re.split(_SEPARATOR, answer):
+        pieces = re.split(r"=|(?=≈)", part)
+        if len(pieces) > 1 and _LABEL.match(pieces[0]):
+            parts.append((pieces[1:], True))
+        else:
+            parts.append((pieces, False))
+    return parts
+
+def expected_values(solution: str) -> Optional[List[Value]]:
+    """
+    Every form of a numeric expected solution, e.g. "1/12 = .0833... = 8.333...%" gives three Values.
+
+    Returns None for solutions that are not a single number: prose, multi-part answers, inequalities,
+    expressions with variables, ...
+    """
+    text = re.sub(r"\([^()]*(?:[A-Za-z]{3,}|=)[^()]*\)", "", solution)
+    text = re.split(r"(?<!\d)\.\s+(?=[A-Z])|\.\s+(?=[A-Z][a-z])", text)[0]
+    if _NOT_NUMERIC.search(text):
+        return None
+    forms: List[Value] = []
+    for pieces, labelled in _parts(text):
+        values = [parse_value(piece) for piece in pieces if piece.strip()]
+        if not values or values[-1] is None or (None in values and not labelled):
+            return None
+        final = values[-1]
+        forms.extend(v for v in values if v is not None and equivalent(v, final))
+    if not forms or not all(equivalent(form, forms[-1]) for form in forms):
+        return None
+    return forms
+
+def _last_statement(message: str, patterns) -> List[Value]:
+    """The values of the last statement in message matching one of patterns, or [] if none states a number."""
+    last, values = -1, []
+    for pattern in patterns:
+        for match in pattern.finditer(message):
+            found = []
+            # "1/12, or about 8.33%" states two forms; "x = 2 + 4 = 6" ends with the value.
+            for part in re.split(_SEPARATOR, match.group(1)):
+                for piece in reversed(re.split(r"=|(?=≈)", part)):
+                    value = parse_value(piece)
+                    if value is not None:
+                        found.append(value)
+                        break
+            if found and match.start() > last:
+                last, values = match.start(), found
+    return values
+
+def final_answers(conversation_log: List[Dict[str, str]]) -> Tuple[List[Value], str]:
+    """
+    Extract the answer values of the last answer statement in the last tutor message that states one.
+
+    Returns:
+        Tuple[List[Value], str]: The values, and how far they can be trusted: "explicit" for a
+        "the answer is ..." or \\boxed{} statement, "weak" for bold text, "x = ..." or "... is correct",
+        and "hedged" when the message also negates something or quotes the student ("your answer is ..."),
+        so the stated value may not be the tutor's own final answer.
+    """
+    for message in reversed(conversation_log):
+        if message["role"] != "tutor" or message["content"].startswith("ERROR"):
+            continue
+        content = message["content"]
+        hedged = bool(_NEGATION.search(content) or _QUOTED.search(content))
+        strong = _last_statement(content, _FINAL_ANSWER)
+        if strong:
+            return strong, "hedged" if hedged else "explicit"
+        weak = _last_statement(content, _WEAK_ANSWER)
+        if weak:
+            return weak, "hedged" if hedged else "weak"
+    return [], "weak"
+
+def _form_matches(answer: Value, expected: List[Value], simplify: bool) -> bool:
+    """
+    Whether an answer equal in value is also in an acceptable form: fractions in lowest terms when the
+    expected answer is a fraction or the question asks to simplify, and no decimal for a simplify question
+    unless a decimal form is expected.
+    """
+    fraction_expected = any("/" in form.written for form in expected)
+    if (simplify or fraction_expected) and not answer.reduced():
+        return False
+    if simplify and answer.decimals is not None and all(form.decimals is None for form in expected):
+        return False
+    return True
+
+def check(conversation_log: List[Dict[str, str]], expected_solution: str,
+          question: str = "") -> Tuple[Optional[bool], str]:
+    """
+    Decide solution_matches without an LLM where possible.
+
+    Args:
+        conversation_log (List[Dict[str, str]]): The conversation, as {"role", "content"} messages.
+        expected_solution (str): The solution column of the benchmark CSV.
+        question (str): The question column, used to spot questions asking for a simplified form.
+
+    Returns:
+        Tuple[Optional[bool], str]: True or False when the check is conclusive, None when the LLM judge
+        should decide; and a short explanation.
+    """
+    expected = expected_values(expected_solution)
+    if expected is None:
+        return None, "expected solution is not a single number"
+    answers, strength = final_answers(conversation_log)
+    if not answers:
+        return None, "no final answer found in the conversation"
+    if strength == "hedged":
+        return None, "the final message negates or quotes an answer"
+    simplify = bool(_SIMPLIFY.search(question))
+    unsimplified = None
+    for answer in answers:
+        if any(equivalent(answer, form) for form in expected):
+            if _form_matches(answer, expected, simplify):
+                return True, f"final answer {answer.written} matches {expected_solution!r}"
+            unsimplified = unsimplified or answer
+    if unsimplified is not None:
+        return None, f"final answer {unsimplified.written} has the right value but may not be in the expected form"
+    if strength == "explicit":
+        return False, f"final answer {answers[-1].written} does not match {expected_solution!r}"
+    return None, "final answer does not clearly match"
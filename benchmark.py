@@ -2,12 +2,22 @@ import os
 import csv
 import json
 import time
-from typing import Dict, List, Tuple, Optional
-from dataclasses import dataclass
+import hashlib
+import argparse
+import threading
+import itertools
+import heapq
+import sys
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Tuple, Optional
+from dataclasses import asdict, dataclass, field
 from dotenv import load_dotenv
 import requests
 import google.generativeai as genai
 import re
+import answer_checker
+from tools import replay
 
 @dataclass
 class BenchmarkResult:
@@ -19,33 +29,336 @@ class BenchmarkResult:
     solution_matches: bool
     conversation_log: List[Dict[str, str]]
     evaluation_details: str
+    # One entry per tutor reply: ttft, total, tokens, chunks, tokens_per_second (seconds; ttft is None when
+    # blocking; tokens and tokens_per_second are None when Dify reports no usage)
+    turn_timings: List[Dict] = field(default_factory=list)
+    # Who decided solution_matches: "local" (answer_checker) or "judge" (Gemini)
+    solution_check: str = "judge"
+    # Wall time per turn in seconds, rate limiting included: {"student", "tutor"}; the first turn has no student call
+    turn_wall_times: List[Dict] = field(default_factory=list)
+    evaluation_time: Optional[float] = None
+    wall_time: Optional[float] = None
+
+SCENARIOS = ("perfect_student", "imperfect_student")
+CHECKPOINT_FILE = "math_tutor_benchmark_checkpoint.jsonl"
+LEGACY_RESULTS_FILE = "math_tutor_benchmark_results.json"
+
+def turn_timing(ttft: Optional[float], total: float, tokens: Optional[int], chunks: Optional[int] = None) -> Dict:
+    generation = total - (ttft or 0)
+    return {
+        "ttft": ttft,
+        "total": total,
+        "tokens": tokens,
+        # SSE message events, not tokens; kept apart so a missing usage count never stands in for tokens
+        "chunks": chunks,
+        "tokens_per_second": tokens / generation if tokens and generation > 0 else None
+    }
+
+def latency_stats(values: List[float]) -> Dict:
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return {}
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {"mean": sum(values) / len(values), "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99),
+            "max": values[-1], "count": len(values)}
+
+def record_latency(record: Dict) -> Dict:
+    """Wall-time breakdown of one checkpointed scenario; empty for records from before timings were kept."""
+    walls = record.get("turn_wall_times") or []
+    if not walls:
+        return {}
+    tutor = [w["tutor"] for w in walls if w.get("tutor") is not None]
+    student = [w["student"] for w in walls if w.get("student") is not None]
+    return {
+        "wall_time": record.get("wall_time"),
+        "tutor_time": sum(tutor),
+        "student_time": sum(student),
+        "evaluation_time": record.get("evaluation_time") or 0.0,
+        "tutor_call": latency_stats(tutor),
+        "student_call": latency_stats(student)
+    }
+
+def question_key(question: str) -> str:
+    """Stable id for a question, independent of its position in the CSV."""
+    return hashlib.sha256(question.strip().encode("utf-8")).hexdigest()[:16]
+
+def parse_shard(text: str) -> Tuple[int, int]:
+    """Parse "i/N" (0 <= i < N) into (i, N)."""
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", text)
+    if not match or not 0 <= int(match.group(1)) < int(match.group(2)):
+        raise ValueError(f"shard must be i/N with 0 <= i < N, got {text!r}")
+    return int(match.group(1)), int(match.group(2))
+
+def in_shard(question: str, shard: Optional[Tuple[int, int]]) -> bool:
+    """True if the question belongs to shard (i, N). Decided by its hash, so every machine agrees."""
+    if shard is None:
+        return True
+    index, count = shard
+    return int(question_key(question), 16) % count == index
+
+def shard_checkpoint_path(shard: Optional[Tuple[int, int]], path: str = CHECKPOINT_FILE) -> str:
+    """Default checkpoint of a shard, e.g. math_tutor_benchmark_checkpoint.shard-0-of-4.jsonl."""
+    if shard is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard-{shard[0]}-of-{shard[1]}{ext}"
+
+def iter_problems(csv_files: List[str], shard: Optional[Tuple[int, int]] = None) -> Iterator[Tuple[str, str]]:
+    """Stream (question, solution) pairs from CSV files, one row at a time, keeping only those in shard."""
+    for csv_file in csv_files:
+        try:
+            with open(csv_file, 'r', encoding='utf-8') as file:
+                reader = csv.DictReader(file)
+                for row in reader:
+                    # Assuming CSV has 'question' and 'solution' columns
+                    # Adjust column names as needed
+                    question = row.get('question', row.get('Question', ''))
+                    solution = row.get('solution', row.get('Solution', ''))
+                    if question and solution and in_shard(question, shard):
+                        yield question.strip(), solution.strip()
+        except Exception as e:
+            print(f"ERROR loading {csv_file}: {str(e)}")
+
+class Checkpoint:
+    """
+    Append-only JSONL file with one finished scenario per line, keyed by (question hash, scenario).
+
+    Reading never modifies the file; a writer calls repair() before its first append.
+    """
+    def __init__(self, path: str = CHECKPOINT_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def repair(self):
+        """Terminate a line left half-written by a crash so the next record starts on its own line."""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    def append(self, result: BenchmarkResult):
+        line = json.dumps({"key": question_key(result.question), **asdict(result)}) + "\n"
+        with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def __iter__(self) -> Iterator[Dict]:
+        """Stream records, skipping corrupt lines and repeats of a (question, scenario) already seen."""
+        if not os.path.exists(self.path):
+            return
+        seen = set()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                key = (record.get("key"), record.get("scenario"))
+                if key in seen:
+                    continue
+                seen.add(key)
+                yield record
+
+    def completed_keys(self) -> set:
+        return {(record["key"], record["scenario"]) for record in self}
+
+    def import_legacy(self, results_file: str = LEGACY_RESULTS_FILE, shard: Optional[Tuple[int, int]] = None):
+        """
+        Seed an empty checkpoint from an old report's detailed_results (which has no conversation logs),
+        keeping only the questions in shard.
+        """
+        if os.path.exists(self.path) or not os.path.exists(results_file):
+            return
+        with open(results_file, 'r') as f:
+            past_results = json.load(f)["detailed_results"]
+        for r in past_results:
+            if not in_shard(r["question"], shard):
+                continue
+            self.append(BenchmarkResult(
+                question=r["question"],
+                expected_solution=r["expected_solution"],
+                scenario=r["scenario"],
+                logic_correct=r["logic_correct"],
+                corrected_when_wrong=r["corrected_when_wrong"],
+                solution_matches=r["solution_matches"],
+                conversation_log=[],
+                evaluation_details=r["evaluation_details"]
+            ))
+
+def merged_records(checkpoints: List[Checkpoint]) -> Iterator[Dict]:
+    """Stream the records of several checkpoints, skipping a (question, scenario) already seen in an earlier one."""
+    seen = set()
+    for checkpoint in checkpoints:
+        for record in checkpoint:
+            key = (record.get("key"), record.get("scenario"))
+            if key in seen:
+                continue
+            seen.add(key)
+            yield record
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread at a fixed interval and writes them in folded format
+    ("frame;frame;frame count" per line, readable by flamegraph.pl or speedscope).
+
+    Unlike cProfile, which only sees the thread that enabled it, this covers the pool threads running the
+    conversations, and since it records where threads wait it shows wall time rather than CPU time.
+    """
+    def __init__(self, output_file: str, interval: float = 0.005):
+        self.output_file = output_file
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        with open(self.output_file, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"\nPROFILE ({self.samples} samples every {self.interval * 1000:g} ms, folded stacks in {self.output_file}):")
+        inclusive: Counter = Counter()
+        for stack, count in self.stacks.items():
+            for frame in set(stack.split(";")):
+                inclusive[frame] += count
+        total = sum(self.stacks.values()) or 1
+        for frame, count in inclusive.most_common(15):
+            print(f"  {count / total:6.1%}  {frame}")
+
+class RateLimiter:
+    """Thread-safe token bucket allowing `per_minute` requests per minute with bursts of up to `burst`."""
+    def __init__(self, per_minute: float, burst: int = 1):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent. A non-positive rate never blocks."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
 
 class MathTutorAgent:
-    def __init__(self):
+    def __init__(self, rate_limiter: Optional[RateLimiter] = None, replay_tag: str = "", streaming: bool = True):
         load_dotenv()
         self.dify_api_key = os.getenv("DIFY_API_KEY")
         self.base_url = "http://127.0.0.1/v1"
         self.conversation_id = None
+        self.rate_limiter = rate_limiter or RateLimiter(0)
+        # Distinguishes conversations that open with the same query (e.g. both scenarios of one problem)
+        # so each replays its own recording.
+        self.replay_tag = replay_tag
+        self.response_mode = "streaming" if streaming else "blocking"
+        # Timing of the most recent reply, see turn_timing()
+        self.last_timing: Optional[Dict] = None
+
+    def _chat(self, body: Dict) -> Dict:
+        """
+        POST to /chat-messages (or replay a recording).
+
+        Returns a dict with status_code and either answer, conversation_id and timing, or error.
+        """
+        headers = {
+            "Authorization": f"Bearer {self.dify_api_key}",
+            "Content-Type": "application/json"
+        }
+
+        def post() -> Dict:
+            start = time.perf_counter()
+            if body["response_mode"] == "streaming":
+                return self._read_stream(
+                    requests.post(f"{self.base_url}/chat-messages", json=body, headers=headers, stream=True), start)
+            response = requests.post(f"{self.base_url}/chat-messages", json=body, headers=headers)
+            total = time.perf_counter() - start
+            if response.status_code != 200:
+                return {"status_code": response.status_code, "error": response.text}
+            data = response.json()
+            tokens = data.get("metadata", {}).get("usage", {}).get("completion_tokens")
+            return {"status_code": 200, "answer": data.get("answer"), "conversation_id": data.get("conversation_id"),
+                    "timing": turn_timing(None, total, tokens)}
+
+        # Outside the recorded call, so fixtures hold service time only and not waits for the limiter.
+        if replay.mode != "replay":
+            self.rate_limiter.acquire()
+        response = replay.call("dify", {"tag": self.replay_tag, "body": body}, post)
+        self.last_timing = response.get("timing")
+        return response
+
+    @staticmethod
+    def _read_stream(response: requests.Response, start: float) -> Dict:
+        """Consume Dify's SSE stream, timing the first answer chunk and the end of the stream."""
+        with response:
+            if response.status_code != 200:
+                return {"status_code": response.status_code, "error": response.text}
+            response.encoding = "utf-8"
+            chunks, conversation_id, ttft, tokens = [], None, None, None
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                event = json.loads(line[len("data:"):])
+                kind = event.get("event")
+                conversation_id = event.get("conversation_id") or conversation_id
+                if kind in ("message", "agent_message") and event.get("answer"):
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    chunks.append(event["answer"])
+                elif kind == "message_end":
+                    tokens = event.get("metadata", {}).get("usage", {}).get("completion_tokens")
+                elif kind == "error":
+                    return {"status_code": event.get("status", 500), "error": event.get("message", "")}
+            total = time.perf_counter() - start
+        return {"status_code": 200, "answer": "".join(chunks), "conversation_id": conversation_id,
+                "timing": turn_timing(ttft, total, tokens, len(chunks))}
         
     def start_conversation(self, query: str) -> str:
         """Start a new conversation with the Math Tutor Agent."""
         body = {
             "query": query,
-            "response_mode": "blocking",
+            "response_mode": self.response_mode,
             "user": "benchmark",
             "conversation_id": "",
             "inputs": {}
         }
-        headers = {
-            "Authorization": f"Bearer {self.dify_api_key}",
-            "Content-Type": "application/json"
-        }
         try:
-            response = requests.post(f"{self.base_url}/chat-messages", json=body, headers=headers)
-            if response.status_code == 200:
-                self.conversation_id = response.json().get("conversation_id")
-                return response.json().get("answer")
-            return f"ERROR: {response.status_code}\n{response.text}"
+            response = self._chat(body)
+            if response["status_code"] == 200:
+                self.conversation_id = response["conversation_id"]
+                return response["answer"]
+            return f"ERROR: {response['status_code']}\n{response['error']}"
         except Exception as e:
             return f"ERROR: {str(e)}"
 
@@ -56,28 +369,34 @@ class MathTutorAgent:
             
         body = {
             "query": query,
-            "response_mode": "blocking",
+            "response_mode": self.response_mode,
             "user": "benchmark",
             "conversation_id": self.conversation_id,
             "inputs": {}
         }
-        headers = {
-            "Authorization": f"Bearer {self.dify_api_key}",
-            "Content-Type": "application/json"
-        }
         try:
-            response = requests.post(f"{self.base_url}/chat-messages", json=body, headers=headers)
-            if response.status_code == 200:
-                return response.json().get("answer")
-            return f"ERROR: {response.status_code} - {response.text}"
+            response = self._chat(body)
+            if response["status_code"] == 200:
+                return response["answer"]
+            return f"ERROR: {response['status_code']} - {response['error']}"
         except Exception as e:
             return f"ERROR: {str(e)}"
 
 class GeminiEvaluator:
-    def __init__(self):
+    def __init__(self, rate_limiter: Optional[RateLimiter] = None):
         load_dotenv()
         genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
         self.model = genai.GenerativeModel('gemini-2.0-flash-001')
+        self.rate_limiter = rate_limiter or RateLimiter(0)
+
+    def generate(self, prompt: str) -> str:
+        """Call Gemini once the rate limiter allows it (or replay a recording) and return the response text."""
+        def generate_live() -> Dict:
+            return {"text": self.model.generate_content(prompt).text}
+
+        if replay.mode != "replay":
+            self.rate_limiter.acquire()
+        return replay.call("gemini", {"prompt": prompt}, generate_live)["text"]
         
     def act_as_perfect_student(self, tutor_response: str, question: str, expected_solution: str) -> str:
         """Gemini acts as a perfect student who understands everything correctly."""
@@ -95,8 +414,7 @@ class GeminiEvaluator:
         """
         
         try:
-            response = self.model.generate_content(prompt)
-            return response.text
+            return self.generate(prompt)
         except Exception as e:
             return f"Error generating perfect student response: {str(e)}"
     
@@ -126,14 +444,25 @@ class GeminiEvaluator:
         """
         
         try:
-            response = self.model.generate_content(prompt)
-            return response.text
+            return self.generate(prompt)
         except Exception as e:
             return f"ERROR generating imperfect student response: {str(e)}"
     
     def evaluate_conversation(self, conversation_log: List[Dict], question: str, 
-                            expected_solution: str, scenario: str) -> Tuple[bool, bool, bool, str]:
-        """Evaluate the entire conversation for logic correctness, error correction, and solution accuracy."""
+                            expected_solution: str, scenario: str,
+                            solution_matches: Optional[bool] = None) -> Tuple[bool, bool, bool, str]:
+        """
+        Evaluate the entire conversation for logic correctness, error correction, and solution accuracy.
+
+        If solution_matches was already decided (by answer_checker), the judge is told so instead of asked.
+        """
+        if solution_matches is None:
+            solution_criterion = """3. SOLUTION_MATCHES: 
+           - TRUE only if the final answer matches the expected solution OR mathematically equivalent (e.g. fraction vs. decimal)
+           - FALSE if the answer is wrong"""
+        else:
+            solution_criterion = f"""3. SOLUTION_MATCHES: already checked, the final answer {"matches" if solution_matches else "does NOT match"} the expected solution.
+           Report {str(solution_matches).lower()}."""
         
         conversation_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in conversation_log])
         
@@ -160,9 +489,7 @@ class GeminiEvaluator:
            - FALSE if any student error was missed, incorrectly identified, or poorly corrected
            - TRUE by default if student made no errors in perfect student scenario
         
-        3. SOLUTION_MATCHES: 
-           - TRUE only if the final answer matches the expected solution OR mathematically equivalent (e.g. fraction vs. decimal)
-           - FALSE if the answer is wrong
+        {solution_criterion}
         
         Respond in this exact JSON format:
         {{
@@ -174,55 +501,42 @@ class GeminiEvaluator:
         """
         
         try:
-            response = self.model.generate_content(prompt)
-            text = re.search(r'```json\s*\n(.*?)\n```', response.text, re.DOTALL).group(1)
+            response_text = self.generate(prompt)
+            text = re.search(r'```json\s*\n(.*?)\n```', response_text, re.DOTALL).group(1)
             print(text)
             evaluation = json.loads(text)
             
             return (
                 evaluation.get("logic_correct", False),
                 evaluation.get("corrected_when_wrong", False), 
-                evaluation.get("solution_matches", False),
+                evaluation.get("solution_matches", False) if solution_matches is None else solution_matches,
                 evaluation.get("evaluation_details", "")
             )
         except Exception as e:
-            return False, False, False, f"Evaluation ERROR: {str(e)}"
+            return False, False, bool(solution_matches), f"Evaluation ERROR: {str(e)}"
 
 class MathTutorBenchmark:
-    def __init__(self):
-        self.agent = MathTutorAgent()
-        self.evaluator = GeminiEvaluator()
-        self.results: List[BenchmarkResult] = []
-        with open("math_tutor_benchmark_results.json", 'r') as f:
-            past_results = json.load(f)["detailed_results"]
-            self.results = [BenchmarkResult(
-                question=r["question"],
-                expected_solution=r["expected_solution"],
-                scenario=r["scenario"],
-                logic_correct=r["logic_correct"],
-                corrected_when_wrong=r["corrected_when_wrong"],
-                solution_matches=r["solution_matches"],
-                conversation_log="",
-                evaluation_details=r["evaluation_details"]
-            ) for r in past_results]
+    def __init__(self, dify_per_minute: Optional[float] = None, gemini_per_minute: Optional[float] = None,
+                 checkpoint_path: Optional[str] = None, streaming: bool = True,
+                 shard: Optional[Tuple[int, int]] = None):
+        load_dotenv()
+        self.streaming = streaming
+        # (i, N): only run the questions whose hash falls in shard i of N. None runs everything.
+        self.shard = shard
+        if dify_per_minute is None:
+            dify_per_minute = float(os.getenv("DIFY_REQUESTS_PER_MINUTE", "60"))
+        if gemini_per_minute is None:
+            gemini_per_minute = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "15"))
+        # Shared by every conversation so the limits hold however many run in parallel.
+        self.dify_limiter = RateLimiter(dify_per_minute)
+        self.evaluator = GeminiEvaluator(RateLimiter(gemini_per_minute))
+        self.checkpoint = Checkpoint(checkpoint_path or shard_checkpoint_path(shard))
+        self.checkpoint.repair()
+        self.checkpoint.import_legacy(shard=shard)
 
     def load_problems(self, csv_files: List[str]) -> List[Tuple[str, str]]:
-        """Load math problems and solutions from CSV files."""
-        problems = []
-        for csv_file in csv_files:
-            try:
-                with open(csv_file, 'r', encoding='utf-8') as file:
-                    reader = csv.DictReader(file)
-                    for row in reader:
-                        # Assuming CSV has 'question' and 'solution' columns
-                        # Adjust column names as needed
-                        question = row.get('question', row.get('Question', ''))
-                        solution = row.get('solution', row.get('Solution', ''))
-                        if question and solution:
-                            problems.append((question.strip(), solution.strip()))
-            except Exception as e:
-                print(f"ERROR loading {csv_file}: {str(e)}")
-        return problems
+        """Load math problems and solutions from CSV files (this benchmark's shard only)."""
+        return list(iter_problems(csv_files, self.shard))
     
     def run_scenario(self, question: str, expected_solution: str, scenario: str, 
                     max_turns: int = 10) -> BenchmarkResult:
@@ -232,13 +546,20 @@ class MathTutorBenchmark:
         print(f"Question: {question}")
         print(f"{'='*50}")
         
-        # Reset agent for new conversation
-        self.agent.conversation_id = None
+        # Each conversation gets its own agent so conversations can run in parallel
+        agent = MathTutorAgent(self.dify_limiter, replay_tag=scenario, streaming=self.streaming)
         conversation_log = []
+        turn_timings = []
+        turn_wall_times = []
+        scenario_start = time.perf_counter()
         
         # Start conversation
         initial_query = f"Help me solve this problem: {question}"
-        tutor_response = self.agent.start_conversation(initial_query)
+        call_start = time.perf_counter()
+        tutor_response = agent.start_conversation(initial_query)
+        turn_wall_times.append({"student": None, "tutor": time.perf_counter() - call_start})
+        if agent.last_timing:
+            turn_timings.append(agent.last_timing)
         
         conversation_log.append({"role": "student", "content": initial_query})
         conversation_log.append({"role": "tutor", "content": tutor_response})
@@ -249,6 +570,7 @@ class MathTutorBenchmark:
         for turn in range(max_turns - 1):
             if "Finished" in tutor_response:
                 break
+            call_start = time.perf_counter()
             if scenario == "perfect_student":
                 student_response = self.evaluator.act_as_perfect_student(
                     tutor_response, question, expected_solution
@@ -257,6 +579,8 @@ class MathTutorBenchmark:
                 student_response = self.evaluator.act_as_imperfect_student(
                     tutor_response, question, expected_solution, conversation_log
                 )
+            wall = {"student": time.perf_counter() - call_start, "tutor": None}
+            turn_wall_times.append(wall)
             
             if "ERROR" in student_response:
                 print(student_response)
@@ -271,20 +595,26 @@ class MathTutorBenchmark:
                 if turn >= 2:  # Minimum conversation length
                     break
             
-            tutor_response = self.agent.continue_conversation(student_response)
+            agent.last_timing = None
+            call_start = time.perf_counter()
+            tutor_response = agent.continue_conversation(student_response)
+            wall["tutor"] = time.perf_counter() - call_start
+            if agent.last_timing:
+                turn_timings.append(agent.last_timing)
             conversation_log.append({"role": "tutor", "content": tutor_response})
             print(f"TUTOR: {tutor_response}")
             
             if "ERROR" in tutor_response:
                 break
-            
-            time.sleep(5)
         
-        # Evaluate the conversation
+        # Evaluate the conversation; the judge decides solution_matches only if the local check can't
+        evaluation_start = time.perf_counter()
+        local_match, check_details = answer_checker.check(conversation_log, expected_solution, question)
         logic_correct, corrected_when_wrong, solution_matches, details = \
-            self.evaluator.evaluate_conversation(conversation_log, question, expected_solution, scenario)
-            
-        time.sleep(5)
+            self.evaluator.evaluate_conversation(conversation_log, question, expected_solution, scenario, local_match)
+        if local_match is not None:
+            details = f"{details}\nSolution checked locally: {check_details}"
+        evaluation_end = time.perf_counter()
         
         result = BenchmarkResult(
             question=question,
@@ -294,114 +624,293 @@ class MathTutorBenchmark:
             corrected_when_wrong=corrected_when_wrong,
             solution_matches=solution_matches,
             conversation_log=conversation_log,
-            evaluation_details=details
+            evaluation_details=details,
+            turn_timings=turn_timings,
+            solution_check="judge" if local_match is None else "local",
+            turn_wall_times=turn_wall_times,
+            evaluation_time=evaluation_end - evaluation_start,
+            wall_time=evaluation_end - scenario_start
         )
         
-        self.results.append(result)
         return result
     
-    def run_benchmark(self, csv_files: List[str], start: Optional[int] = None, sample_size: Optional[int] = None):
-        """Run the complete benchmark on problems from CSV files."""
-        problems = self.load_problems(csv_files)
-        
-        if start and sample_size:
-            problems = problems[start:start + sample_size]
-        elif start:
-            problems = problems[start:]
-        elif sample_size:
-            problems = problems[:sample_size]
-        
-        print(f"Loaded {len(problems)} problems from {csv_files}")
-        
-        for i, (question, solution) in enumerate(problems):
-            if i < len(self.results):
-                continue
-            print(f"\n\nPROBLEM {i+1}/{len(problems)}")
-            
-            # Run perfect student scenario
-            perfect_result = self.run_scenario(question, solution, "perfect_student")
-            
-            # Run imperfect student scenario  
-            imperfect_result = self.run_scenario(question, solution, "imperfect_student")
-            
-            if "ERROR" in perfect_result.evaluation_details or \
-                "ERROR" in str(perfect_result.conversation_log) or \
-                "ERROR" in imperfect_result.evaluation_details or \
-                "ERROR" in str(imperfect_result.conversation_log):
+    def run_benchmark(self, csv_files: List[str], start: Optional[int] = None, sample_size: Optional[int] = None,
+                      concurrency: int = 1):
+        """
+        Run the complete benchmark on problems from CSV files, with up to `concurrency` conversations at once.
+
+        Problems are streamed from the CSVs rather than loaded up front; start and sample_size slice this
+        benchmark's shard.
+        """
+        first = start or 0
+        problems = itertools.islice(iter_problems(csv_files, self.shard), first,
+                                    first + sample_size if sample_size else None)
+        shard = f" (shard {self.shard[0]}/{self.shard[1]})" if self.shard else ""
+        print(f"Running problems from {csv_files}{shard}; finished ones are skipped using {self.checkpoint.path}")
+        
+        completed = self.checkpoint.completed_keys()
+        stop = threading.Event()
+
+        def jobs():
+            queued = set()
+            for i, (question, solution) in enumerate(problems):
+                for scenario in SCENARIOS:
+                    key = (question_key(question), scenario)
+                    if key not in completed and key not in queued:
+                        queued.add(key)
+                        yield i, question, solution, scenario
+
+        def run(i: int, question: str, solution: str, scenario: str):
+            if stop.is_set():
+                return
+            print(f"\n\nPROBLEM {i+1} ({scenario})")
+            result = self.run_scenario(question, solution, scenario)
+            if "ERROR" in result.evaluation_details or "ERROR" in str(result.conversation_log):
+                # Not checkpointed, so the scenario is retried on the next run.
                 print("Error encountered during benchmark, stopping further tests.")
-                self.results.pop()
-                self.results.pop()
-                break
+                stop.set()
+                return
+            self.checkpoint.append(result)
+
+        workers = max(1, concurrency)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # Keep only a few jobs queued ahead of the workers so the CSVs are read as the run progresses.
+            pending = set()
+            for job in jobs():
+                if stop.is_set():
+                    break
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                pending.add(pool.submit(run, *job))
+            for future in pending:
+                future.result()
     
     def generate_report(self, output_file: str = "benchmark_report.json"):
-        """Generate a comprehensive benchmark report."""
-        perfect_results = [r for r in self.results if r.scenario == "perfect_student"]
-        imperfect_results = [r for r in self.results if r.scenario == "imperfect_student"]
-        
-        def calculate_metrics(results):
-            if not results:
-                return {}
-            return {
-                "logic_correct_rate": sum(r.logic_correct for r in results) / len(results),
-                "correction_rate": sum(r.corrected_when_wrong for r in results) / len(results),
-                "solution_match_rate": sum(r.solution_matches for r in results) / len(results),
-                "perfect_performance_rate": sum(all([r.logic_correct, r.corrected_when_wrong, r.solution_matches]) for r in results) / len(results),
-                "total_problems": len(results)
+        """Generate a comprehensive benchmark report from this run's checkpoint. See generate_report."""
+        generate_report([self.checkpoint], output_file)
+
+def generate_report(checkpoints: List[Checkpoint], output_file: str = "benchmark_report.json",
+                    slowest: int = 10):
+    """
+    Generate a comprehensive benchmark report by streaming over one or more checkpoints.
+
+    Several checkpoints (e.g. one per shard) are merged; a (question, scenario) found in more than one
+    is counted once, from the first checkpoint that has it. The `slowest` conversations by wall time
+    are listed with their time split between tutor, student simulation and evaluation.
+    """
+    counts = {scenario: {"n": 0, "logic": 0, "corrected": 0, "solution": 0, "perfect": 0, "local": 0}
+              for scenario in SCENARIOS}
+    questions = set()
+    new_timings = lambda: {"ttft": [], "total": [], "tokens_per_second": [], "tutor_call": [], "student_call": [],
+                           "evaluation_call": [], "conversation": [], "turns": []}
+    timings = {scenario: new_timings() for scenario in SCENARIOS}
+    time_spent = {scenario: Counter() for scenario in SCENARIOS}
+    question_times: Dict[str, float] = {}
+    slowest_heap: List[Tuple[float, int, Dict]] = []
+    for n, record in enumerate(merged_records(checkpoints)):
+        questions.add(record["key"])
+        scenario_timings = timings.setdefault(record["scenario"], new_timings())
+        for timing in record.get("turn_timings", []):
+            for name in ("ttft", "total", "tokens_per_second"):
+                scenario_timings[name].append(timing.get(name))
+        turns = sum(m["role"] == "tutor" for m in record["conversation_log"])
+        if turns:
+            scenario_timings["turns"].append(turns)
+        latency = record_latency(record)
+        if latency:
+            for wall in record["turn_wall_times"]:
+                scenario_timings["tutor_call"].append(wall.get("tutor"))
+                scenario_timings["student_call"].append(wall.get("student"))
+            scenario_timings["evaluation_call"].append(latency["evaluation_time"])
+            scenario_timings["conversation"].append(latency["wall_time"])
+            time_spent.setdefault(record["scenario"], Counter()).update(
+                {part: latency[f"{part}_time"] for part in ("tutor", "student", "evaluation")})
+            question_times[record["key"]] = question_times.get(record["key"], 0.0) + (latency["wall_time"] or 0.0)
+            entry = {
+                "question": record["question"],
+                "scenario": record["scenario"],
+                "wall_time": latency["wall_time"],
+                "turns": turns,
+                "tutor_time": latency["tutor_time"],
+                "student_time": latency["student_time"],
+                "evaluation_time": latency["evaluation_time"]
             }
-        
-        report = {
-            "benchmark_summary": {
-                "total_problems_tested": len(self.results) // 2,
-                "perfect_student_metrics": calculate_metrics(perfect_results),
-                "imperfect_student_metrics": calculate_metrics(imperfect_results)
-            },
-            "detailed_results": []
+            # Bounded min-heap, so only the slowest conversations are kept in memory.
+            heapq.heappush(slowest_heap, (latency["wall_time"] or 0.0, n, entry))
+            if len(slowest_heap) > slowest:
+                heapq.heappop(slowest_heap)
+        c = counts.setdefault(record["scenario"],
+                              {"n": 0, "logic": 0, "corrected": 0, "solution": 0, "perfect": 0, "local": 0})
+        c["n"] += 1
+        c["logic"] += bool(record["logic_correct"])
+        c["corrected"] += bool(record["corrected_when_wrong"])
+        c["solution"] += bool(record["solution_matches"])
+        c["perfect"] += all([record["logic_correct"], record["corrected_when_wrong"], record["solution_matches"]])
+        c["local"] += record.get("solution_check") == "local"
+
+    def calculate_metrics(c):
+        if not c["n"]:
+            return {}
+        return {
+            "logic_correct_rate": c["logic"] / c["n"],
+            "correction_rate": c["corrected"] / c["n"],
+            "solution_match_rate": c["solution"] / c["n"],
+            "perfect_performance_rate": c["perfect"] / c["n"],
+            "solution_checked_locally_rate": c["local"] / c["n"],
+            "total_problems": c["n"]
         }
-        
-        for result in self.results:
-            report["detailed_results"].append({
-                "question": result.question,
-                "expected_solution": result.expected_solution,
-                "scenario": result.scenario,
-                "logic_correct": result.logic_correct,
-                "corrected_when_wrong": result.corrected_when_wrong,
-                "solution_matches": result.solution_matches,
-                "perfect_performance": all([result.logic_correct, result.corrected_when_wrong, result.solution_matches]),
-                "evaluation_details": result.evaluation_details,
-                "conversation_length": len(result.conversation_log)
-            })
-        
-        with open(output_file, 'w') as f:
-            json.dump(report, f, indent=2)
-        
-        print(f"\n{'='*60}")
-        print("BENCHMARK RESULTS SUMMARY")
-        print(f"{'='*60}")
-        print(f"Total Problems Tested: {len(self.results) // 2}")
-        print("\nPERFECT STUDENT SCENARIO:")
-        perfect_metrics = report["benchmark_summary"]["perfect_student_metrics"]
-        for metric, value in perfect_metrics.items():
-            if metric != "total_problems":
-                print(f"  {metric.replace('_', ' ').title()}: {value:.1%}")
-        
-        print("\nIMPERFECT STUDENT SCENARIO:")
-        imperfect_metrics = report["benchmark_summary"]["imperfect_student_metrics"]
-        for metric, value in imperfect_metrics.items():
-            if metric != "total_problems":
-                print(f"  {metric.replace('_', ' ').title()}: {value:.1%}")
-        
-        print(f"\nDetailed report saved to: {output_file}")
+
+    def time_share(spent):
+        total = sum(spent.values())
+        return {part: spent[part] / total for part in ("tutor", "student", "evaluation")} if total else {}
+
+    summary = {
+        "total_problems_tested": len(questions),
+        "perfect_student_metrics": calculate_metrics(counts["perfect_student"]),
+        "imperfect_student_metrics": calculate_metrics(counts["imperfect_student"]),
+        "latency_metrics": {
+            scenario: {
+                "time_to_first_token": latency_stats(timings[scenario]["ttft"]),
+                "generation_time": latency_stats(timings[scenario]["total"]),
+                "tokens_per_second": latency_stats(timings[scenario]["tokens_per_second"]),
+                "tutor_call": latency_stats(timings[scenario]["tutor_call"]),
+                "student_call": latency_stats(timings[scenario]["student_call"]),
+                "evaluation_call": latency_stats(timings[scenario]["evaluation_call"]),
+                "conversation_time": latency_stats(timings[scenario]["conversation"]),
+                "time_share": time_share(time_spent[scenario])
+            } for scenario in SCENARIOS
+        },
+        "turns_to_completion": {
+            scenario: {
+                "stats": latency_stats(timings[scenario]["turns"]),
+                "distribution": {str(turns): count for turns, count in sorted(Counter(timings[scenario]["turns"]).items())}
+            } for scenario in SCENARIOS
+        },
+        # Both scenarios of a question together.
+        "question_time": latency_stats(list(question_times.values())),
+        "slowest_conversations": [entry for _, _, entry in sorted(slowest_heap, key=lambda item: item[:2], reverse=True)]
+    }
+
+    # Written piece by piece so the detailed results never have to be held in memory.
+    with open(output_file, 'w') as f:
+        f.write('{\n  "benchmark_summary": ')
+        f.write(json.dumps(summary, indent=2).replace("\n", "\n  "))
+        f.write(',\n  "detailed_results": [')
+        for n, record in enumerate(merged_records(checkpoints)):
+            detail = {
+                "question": record["question"],
+                "expected_solution": record["expected_solution"],
+                "scenario": record["scenario"],
+                "logic_correct": record["logic_correct"],
+                "corrected_when_wrong": record["corrected_when_wrong"],
+                "solution_matches": record["solution_matches"],
+                "perfect_performance": all([record["logic_correct"], record["corrected_when_wrong"], record["solution_matches"]]),
+                "evaluation_details": record["evaluation_details"],
+                "solution_check": record.get("solution_check", "judge"),
+                "conversation_length": len(record["conversation_log"]),
+                "turn_timings": record.get("turn_timings", []),
+                "latency": record_latency(record)
+            }
+            f.write(("," if n else "") + "\n    " + json.dumps(detail, indent=2).replace("\n", "\n    "))
+        f.write("\n  ]\n}\n")
+
+    print(f"\n{'='*60}")
+    print("BENCHMARK RESULTS SUMMARY")
+    print(f"{'='*60}")
+    print(f"Total Problems Tested: {len(questions)}")
+    print("\nPERFECT STUDENT SCENARIO:")
+    perfect_metrics = summary["perfect_student_metrics"]
+    for metric, value in perfect_metrics.items():
+        if metric != "total_problems":
+            print(f"  {metric.replace('_', ' ').title()}: {value:.1%}")
+
+    print("\nIMPERFECT STUDENT SCENARIO:")
+    imperfect_metrics = summary["imperfect_student_metrics"]
+    for metric, value in imperfect_metrics.items():
+        if metric != "total_problems":
+            print(f"  {metric.replace('_', ' ').title()}: {value:.1%}")
+
+    for scenario, latency in summary["latency_metrics"].items():
+        ttft, tps = latency["time_to_first_token"], latency["tokens_per_second"]
+        if ttft or tps:
+            print(f"\n{scenario.replace('_', ' ').upper()} TUTOR LATENCY:")
+        if ttft:
+            print(f"  Time To First Token: p50 {ttft['p50']:.2f}s, p95 {ttft['p95']:.2f}s")
+        if tps:
+            print(f"  Tokens Per Second: mean {tps['mean']:.1f}, p50 {tps['p50']:.1f}")
+
+    for scenario, latency in summary["latency_metrics"].items():
+        if not latency["conversation_time"]:
+            continue
+        print(f"\n{scenario.replace('_', ' ').upper()} WALL TIME:")
+        for name in ("conversation_time", "tutor_call", "student_call", "evaluation_call"):
+            stats = latency[name]
+            if stats:
+                print(f"  {name.replace('_', ' ').title()}: p50 {stats['p50']:.2f}s, p95 {stats['p95']:.2f}s, "
+                      f"max {stats['max']:.2f}s")
+        share = latency["time_share"]
+        print(f"  Time Share: tutor {share['tutor']:.0%}, student {share['student']:.0%}, "
+              f"evaluation {share['evaluation']:.0%}")
+        turns = summary["turns_to_completion"][scenario]["stats"]
+        if turns:
+            print(f"  Turns To Completion: mean {turns['mean']:.1f}, p50 {turns['p50']}, max {turns['max']}")
+
+    if summary["slowest_conversations"]:
+        print("\nSLOWEST CONVERSATIONS:")
+        for entry in summary["slowest_conversations"][:5]:
+            print(f"  {entry['wall_time']:.1f}s  {entry['scenario']}, {entry['turns']} turns "
+                  f"(tutor {entry['tutor_time']:.1f}s, student {entry['student_time']:.1f}s, "
+                  f"evaluation {entry['evaluation_time']:.1f}s): {entry['question'][:60]}")
+
+    print(f"\nDetailed report saved to: {output_file}")
 
 def main():
     """Example usage of the benchmark system."""
-    benchmark = MathTutorBenchmark()
+    parser = argparse.ArgumentParser(description="Benchmark the Math Tutor Agent.")
+    parser.add_argument("csv_files", nargs="*", default=["benchmark_data/7th.csv"])
+    parser.add_argument("--concurrency", type=int, default=1, help="Conversations to run in parallel.")
+    parser.add_argument("--replay", choices=replay.MODES, default=None,
+                        help="record: save every Dify/Gemini exchange; replay: answer from the fixtures offline.")
+    parser.add_argument("--replay-fixtures", default=None, help="Fixture file (default $REPLAY_FIXTURES).")
+    parser.add_argument("--replay-latency", default=None,
+                        help="'recorded', 'zero' or a fixed number of seconds per replayed call.")
+    parser.add_argument("--response-mode", choices=["streaming", "blocking"], default="streaming",
+                        help="Dify response mode; streaming also records time-to-first-token.")
+    parser.add_argument("--checkpoint", default=None,
+                        help="Append-only JSONL file of finished scenarios; finished ones are skipped on resume "
+                             f"(default {CHECKPOINT_FILE}, or one file per shard).")
+    parser.add_argument("--shard", type=parse_shard, default=None, metavar="i/N",
+                        help="Only run the questions whose hash falls in shard i of N (0-based), e.g. 0/4.")
+    parser.add_argument("--merge", nargs="+", default=None, metavar="CHECKPOINT",
+                        help="Do not run anything; write one report from these checkpoints (e.g. one per shard).")
+    parser.add_argument("--output", default=LEGACY_RESULTS_FILE, help="Report file.")
+    parser.add_argument("--profile", default=None, metavar="FILE",
+                        help="Sample every thread's stack during the run and write folded stacks to FILE.")
+    parser.add_argument("--profile-interval", type=float, default=5, help="Milliseconds between profile samples.")
+    parser.add_argument("--dify-rpm", type=float, default=None,
+                        help="Dify requests per minute (default $DIFY_REQUESTS_PER_MINUTE or 60; 0 = unlimited).")
+    parser.add_argument("--gemini-rpm", type=float, default=None,
+                        help="Gemini requests per minute (default $GEMINI_REQUESTS_PER_MINUTE or 15; 0 = unlimited).")
+    args = parser.parse_args()
+    if args.merge:
+        generate_report([Checkpoint(path) for path in args.merge], args.output)
+        return
+    replay.configure(args.replay, args.replay_fixtures, args.replay_latency)
+
+    benchmark = MathTutorBenchmark(args.dify_rpm, args.gemini_rpm, args.checkpoint,
+                                   streaming=args.response_mode == "streaming", shard=args.shard)
     
     # Run benchmark on sample of problems
-    csv_files = ["benchmark_data/7th.csv"]
-    benchmark.run_benchmark(csv_files) 
+    if args.profile:
+        with SamplingProfiler(args.profile, args.profile_interval / 1000):
+            benchmark.run_benchmark(args.csv_files, concurrency=args.concurrency)
+    else:
+        benchmark.run_benchmark(args.csv_files, concurrency=args.concurrency)
     
     # Generate report
-    benchmark.generate_report("math_tutor_benchmark_results.json")
+    benchmark.generate_report(args.output)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,251 @@
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import httpx
+import stub_wolframalpha
+
+DEFAULT_MIX = "retrieve_notes=5,list_sections=2,solve_math=3"
+PROTOCOL_VERSION = "2025-06-18"
+
+def parse_mix(mix: str) -> List[Tuple[str, float]]:
+    """Parse "tool=weight,tool=weight" into a list of (tool, weight)."""
+    weights = []
+    for part in mix.split(","):
+        tool, _, weight = part.partition("=")
+        weights.append((tool.strip(), float(weight or 1)))
+    return weights
+
+def load_questions(csv_files: List[str]) -> List[str]:
+    questions = []
+    here = os.path.dirname(os.path.abspath(__file__))
+    for csv_file in csv_files:
+        with open(os.path.join(here, csv_file), 'r', encoding='utf-8') as file:
+            questions.extend(row["question"].strip() for row in csv.DictReader(file) if row.get("question"))
+    return questions
+
+class McpClient:
+    """Minimal streamable-HTTP MCP client: JSON-RPC POSTs against one endpoint."""
+
+    def __init__(self, url: str, client: httpx.AsyncClient):
+        self.url = url
+        self.client = client
+        self.session_id: Optional[str] = None
+        self.ids = itertools.count(1)
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json", "Accept": "application/json, text/event-stream",
+                   "MCP-Protocol-Version": PROTOCOL_VERSION}
+        if self.session_id:
+            headers["Mcp-Session-Id"] = self.session_id
+        return headers
+
+    async def _post(self, message: Dict) -> Optional[Dict]:
+        response = await self.client.post(self.url, json=message, headers=self._headers())
+        response.raise_for_status()
+        self.session_id = response.headers.get("Mcp-Session-Id", self.session_id)
+        if "id" not in message or not response.content:
+            return None
+        if response.headers.get("Content-Type", "").startswith("text/event-stream"):
+            for line in response.text.splitlines():
+                if line.startswith("data:"):
+                    return json.loads(line[len("data:"):])
+            return None
+        return response.json()
+
+    async def initialize(self):
+        await self._post({"jsonrpc": "2.0", "id": next(self.ids), "method": "initialize", "params": {
+            "protocolVersion": PROTOCOL_VERSION, "capabilities": {},
+            "clientInfo": {"name": "math-tutor-loadtest", "version": "1.0"}}})
+        await self._post({"jsonrpc": "2.0", "method": "notifications/initialized"})
+
+    async def call_tool(self, name: str, arguments: Dict) -> Tuple[bool, int]:
+        """Call a tool. Returns (ok, response size in bytes)."""
+        reply = await self._post({"jsonrpc": "2.0", "id": next(self.ids), "method": "tools/call",
+                                  "params": {"name": name, "arguments": arguments}})
+        if reply is None or "error" in reply:
+            return False, 0
+        result = reply["result"]
+        text = "".join(item.get("text", "") for item in result.get("content", []))
+        ok = not result.get("isError") and not text.startswith(("Error:", "Notes for section"))
+        return ok, len(text.encode("utf-8"))
+
+class Workload:
+    """Picks the next tool call according to the mix."""
+
+    def __init__(self, mix: List[Tuple[str, float]], grades: List[str], sections: Dict[str, List[str]],
+                 problems: List[str]):
+        self.tools = [tool for tool, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.grades = grades
+        self.sections = sections
+        self.problems = problems
+
+    def next_call(self) -> Tuple[str, Dict]:
+        tool = random.choices(self.tools, self.weights)[0]
+        grade = random.choice(self.grades)
+        if tool == "retrieve_notes":
+            return tool, {"grade": grade, "section": random.choice(self.sections[grade])}
+        if tool in ("list_sections", "section_catalog"):
+            return tool, {"grade": grade}
+        if tool == "search_notes":
+            return tool, {"grade": grade, "query": random.choice(self.problems)}
+        if tool == "solve_math":
+            return tool, {"problem": random.choice(self.problems)}
+        raise ValueError(f"Unsupported tool in mix: {tool}")
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def summarize(samples: List[Tuple[str, float, bool, int]], elapsed: float) -> Dict:
+    def stats(rows):
+        latencies = [latency for _, latency, _, _ in rows]
+        errors = sum(1 for _, _, ok, _ in rows if not ok)
+        return {
+            "requests": len(rows),
+            "errors": errors,
+            "error_rate": errors / len(rows) if rows else 0.0,
+            "requests_per_second": len(rows) / elapsed if elapsed else 0.0,
+            "latency_ms": {
+                "mean": 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+                "p50": 1000 * _percentile(latencies, 0.50),
+                "p95": 1000 * _percentile(latencies, 0.95),
+                "p99": 1000 * _percentile(latencies, 0.99),
+                "max": 1000 * max(latencies) if latencies else 0.0,
+            },
+            "mean_response_bytes": sum(size for *_, size in rows) / len(rows) if rows else 0.0,
+        }
+
+    tools = sorted({tool for tool, *_ in samples})
+    return {
+        "duration_seconds": elapsed,
+        "overall": stats(samples),
+        "tools": {tool: stats([s for s in samples if s[0] == tool]) for tool in tools},
+    }
+
+async def run_load(url: str, workload: Workload, concurrency: int, duration: float,
+                   total_requests: Optional[int], timeout: float) -> Dict:
+    samples: List[Tuple[str, float, bool, int]] = []
+    remaining = itertools.count()
+    deadline = time.perf_counter() + duration
+
+    async def worker(client: httpx.AsyncClient):
+        mcp = McpClient(url, client)
+        await mcp.initialize()
+        while time.perf_counter() < deadline:
+            if total_requests is not None and next(remaining) >= total_requests:
+                return
+            tool, arguments = workload.next_call()
+            start = time.perf_counter()
+            try:
+                ok, size = await mcp.call_tool(tool, arguments)
+            except httpx.HTTPError:
+                ok, size = False, 0
+            samples.append((tool, time.perf_counter() - start, ok, size))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits, follow_redirects=True) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return summarize(samples, elapsed)
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("server.py exited during startup")
+        try:
+            if httpx.get(url.rsplit("/mcp", 1)[0] + "/ready", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("server.py did not come up in time")
+
+def spawn_server(port: int, workers: int, stub_latency: float, stub_error_rate: float,
+                 local_solver: bool, rate_limit: float = 0) -> Tuple[subprocess.Popen, object]:
+    """Start a stub WolframAlpha and server.py wired to it. Returns (server process, stub server)."""
+    stub = stub_wolframalpha.serve("127.0.0.1", 0, stub_latency, stub_error_rate)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    env = dict(os.environ,
+               WOLFRAMALPHA_API_URL=f"http://127.0.0.1:{stub.server_address[1]}/api/v1/llm-api",
+               WOLFRAMALPHA_APP_ID="loadtest",
+               SOLVE_CACHE_PATH="",
+               LOCAL_SOLVER="1" if local_solver else "0",
+               WOLFRAMALPHA_RATE_LIMIT=str(rate_limit),
+               LOG_LEVEL="WARNING",
+               REPLAY_MODE="off")
+    here = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen([sys.executable, os.path.join(here, "server.py"), "--host", "127.0.0.1",
+                                "--port", str(port), "--workers", str(workers)], env=env)
+    return process, stub
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the Math Tutor MCP server over streamable HTTP.")
+    parser.add_argument("--url", default="http://127.0.0.1:8001/mcp", help="MCP endpoint of a running server.")
+    parser.add_argument("--spawn", action="store_true",
+                        help="Start server.py on --port with solve_math pointed at a local stub WolframAlpha.")
+    parser.add_argument("--port", type=int, default=8101, help="Port for --spawn.")
+    parser.add_argument("--workers", type=int, default=1, help="Server worker processes for --spawn.")
+    parser.add_argument("--stub-latency", type=float, default=0.2, help="Stub WolframAlpha latency in seconds.")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--no-local-solver", action="store_true", help="Send every solve_math to the stub.")
+    parser.add_argument("--rate-limit", type=float, default=0,
+                        help="WolframAlpha requests per second per worker for --spawn (0 = no admission limit).")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent simulated clients.")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run.")
+    parser.add_argument("--requests", type=int, default=None, help="Stop after this many requests.")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Tool weights (default {DEFAULT_MIX}).")
+    parser.add_argument("--grades", default="7th,8th")
+    parser.add_argument("--problems", nargs="*", default=["benchmark_data/7th.csv", "benchmark_data/8th.csv"],
+                        help="CSV files whose questions are sent to solve_math.")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout in seconds.")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default=None, help="Write the JSON report here as well as to stdout.")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    process = stub = None
+    url = args.url
+    if args.spawn:
+        url = f"http://127.0.0.1:{args.port}/mcp"
+        process, stub = spawn_server(args.port, args.workers, args.stub_latency, args.stub_error_rate,
+                                     not args.no_local_solver, args.rate_limit)
+    try:
+        if process is not None:
+            wait_until_up(url, process)
+        from tools import note_retriever
+        grades = args.grades.split(",")
+        sections = {grade: [entry["section"] for entry in note_retriever.get_catalog(grade)] for grade in grades}
+        workload = Workload(parse_mix(args.mix), grades, sections, load_questions(args.problems))
+        report = asyncio.run(run_load(url, workload, args.concurrency, args.duration, args.requests, args.timeout))
+        report["config"] = {"url": url, "concurrency": args.concurrency, "mix": args.mix,
+                            "workers": args.workers if args.spawn else None,
+                            "stub_latency": args.stub_latency if args.spawn else None}
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if stub is not None:
+            stub.shutdown()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,133 @@
 from fastmcp import FastMCP
 from dotenv import load_dotenv
-from tools import math_solver
-from tools import note_retriever
+import argparse
+import asyncio
+import contextlib
+import logging
 import os
+import uvicorn
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
 
+# Load .env before importing the tools so their module-level settings see it.
 load_dotenv()
+
+from tools import answer_parser
+from tools import math_solver
+from tools import metrics
+from tools import note_retriever
+from tools import note_search
+from tools import warmup
+
 app_id = os.getenv("WOLFRAMALPHA_APP_ID")
+# Upstream calls a single solve_math_many request may have in flight at once.
+solve_concurrency = int(os.getenv("SOLVE_MATH_CONCURRENCY", "8"))
+batch_max_items = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+
+# Structured per-request logs are single JSON lines on the "math_tutor" logger.
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(message)s")
+# httpx logs every request URL at INFO, and the WolframAlpha URL carries the app id.
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 mcp = FastMCP("math-tutor-mcp-server", json_response=True, stateless_http=True)
 
 @mcp.tool
-def solve_math(problem: str) -> str:
+async def solve_math(problem: str, show_engine: bool = False, compact: bool = math_solver.COMPACT_DEFAULT) -> str:
     """
     Solve a math problem using WolframAlpha. Does not give step-by-step, only the final answer. Does not work for word problems.
     
     Args:
         problem (str): The math problem to solve.
+        show_engine (bool): Append which engine answered (local, cache or wolframalpha).
+        compact (bool): Return only the input interpretation, result and exact/decimal values.
     
     Returns:
         str: The solution to the problem.
     """
-    return math_solver.solve(problem, app_id)
+    with metrics.tool_call("solve_math") as call:
+        text = await math_solver.solve(problem, app_id, show_engine, compact)
+        return call.result(text, error=math_solver.is_error(text))
 
 @mcp.tool
-def retrieve_notes(grade: str, section: str) -> str:
+async def solve_math_many(problems: list[str], show_engine: bool = False,
+                          compact: bool = math_solver.COMPACT_DEFAULT) -> list[dict]:
+    """
+    Solve several math problems at once, e.g. a whole worksheet. Same engine rules as solve_math.
+
+    Args:
+        problems (list[str]): The math problems to solve.
+        show_engine (bool): Include which engine answered each problem.
+        compact (bool): Return only the input interpretation, result and exact/decimal values.
+
+    Returns:
+        list[dict]: One entry per problem, in input order, with "problem" and either "result" or "error".
+    """
+    with metrics.tool_call("solve_math_many") as call:
+        if len(problems) > batch_max_items:
+            raise ValueError(f"At most {batch_max_items} problems per call.")
+        return call.result(await _solve_many(problems, show_engine, compact))
+
+async def _solve_many(problems: list[str], show_engine: bool, compact: bool) -> list[dict]:
+    semaphore = asyncio.Semaphore(solve_concurrency)
+
+    async def solve_one(problem: str) -> dict:
+        async with semaphore:
+            try:
+                text, engine = await math_solver.solve_with_engine(problem, app_id)
+            except Exception as e:
+                return {"problem": problem, "error": str(e)}
+        item = {"problem": problem, "error": text} if math_solver.is_error(text) else \
+            {"problem": problem, "result": answer_parser.compact(text) if compact else text}
+        if show_engine:
+            item["engine"] = engine
+        return item
+
+    return await asyncio.gather(*(solve_one(problem) for problem in problems))
+
+@mcp.tool
+def retrieve_notes(grade: str, section: str, headings: list[str] | None = None, max_tokens: int = 0) -> str:
     """
     Retrieve notes from a specific section.
 
     Args:
         grade (str): The grade level of the notes. Ex: 7th or 8th.
         section (str): The section to retrieve notes from. Ex: 1.1, 4.3, etc.
+        headings (list[str] | None): Only return these subsections. Ex: ["Section Overview", "Concepts and Skills"].
+        max_tokens (int): Approximate token budget for the notes; 0 means no limit.
 
     Returns:
         str: The retrieved notes.
     """
-    return note_retriever.retrieve(grade, section)
+    with metrics.tool_call("retrieve_notes") as call:
+        return call.result(note_retriever.retrieve(grade, section, headings, max_tokens),
+                           error=note_retriever.get_section(grade, section) is None)
+
+@mcp.tool
+def retrieve_notes_many(grade: str, sections: list[str], headings: list[str] | None = None,
+                        max_tokens: int = 0) -> list[dict]:
+    """
+    Retrieve notes from several sections at once. Same options as retrieve_notes, applied to each section.
+
+    Args:
+        grade (str): The grade level of the notes. Ex: 7th or 8th.
+        sections (list[str]): The sections to retrieve notes from. Ex: ["1.1", "1.2", "1.3"].
+        headings (list[str] | None): Only return these subsections. Ex: ["Section Overview"].
+        max_tokens (int): Approximate token budget per section; 0 means no limit.
+
+    Returns:
+        list[dict]: One entry per section, in input order, with "section" and either "notes" or "error".
+    """
+    with metrics.tool_call("retrieve_notes_many") as call:
+        if len(sections) > batch_max_items:
+            raise ValueError(f"At most {batch_max_items} sections per call.")
+        results = []
+        for section in sections:
+            if note_retriever.get_section(grade, section) is None:
+                results.append({"section": section, "error": f"Notes for section {section} not found."})
+            else:
+                results.append({"section": section,
+                                "notes": note_retriever.retrieve(grade, section, headings, max_tokens)})
+        return call.result(results)
 
 @mcp.tool
 def list_sections(grade: str) -> str:
@@ -47,11 +140,97 @@ def list_sections(grade: str) -> str:
     Returns:
         str: A string with each section_id and title on a new line.
     """
-    return note_retriever.get_sections(grade)
+    with metrics.tool_call("list_sections") as call:
+        return call.result(note_retriever.get_sections(grade))
+
+@mcp.tool
+def section_catalog(grade: str) -> list[dict]:
+    """
+    Get structured metadata for every section of a grade, ordered by module and section number.
+
+    Args:
+        grade (str): The grade level to retrieve sections for. Ex: 7th or 8th.
+
+    Returns:
+        list[dict]: Each entry has grade, module, section, title and size (bytes).
+    """
+    with metrics.tool_call("section_catalog") as call:
+        return call.result(note_retriever.get_catalog(grade))
+
+@mcp.tool
+def search_notes(grade: str, query: str, k: int = 5) -> list[dict]:
+    """
+    Search the notes of a grade and return the best matching sections.
+
+    Args:
+        grade (str): The grade level to search. Ex: 7th or 8th.
+        query (str): What to look for. Ex: "scale factor", "slope of a line".
+        k (int): Maximum number of sections to return.
+
+    Returns:
+        list[dict]: Ranked matches, each with section, title, score and a snippet.
+    """
+    with metrics.tool_call("search_notes") as call:
+        return call.result(note_search.search(grade, query, k))
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    """Prometheus scrape endpoint. With several workers each scrape reports the worker that answered."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@mcp.custom_route("/health", methods=["GET"])
+async def health_endpoint(request: Request) -> JSONResponse:
+    """Liveness: always 200 while the worker is serving, with the warm-up state and step timings."""
+    return JSONResponse(warmup.state)
+
+@mcp.custom_route("/ready", methods=["GET"])
+async def ready_endpoint(request: Request) -> JSONResponse:
+    """Readiness: 503 until the worker that answered has finished warming up, then 200."""
+    return JSONResponse(warmup.state, status_code=200 if warmup.ready() else 503)
+
+@contextlib.asynccontextmanager
+async def lifespan(starlette_app):
+    """Per-worker startup and shutdown around the MCP session manager's own lifespan."""
+    # Warm up in the background so /health answers at once and /ready reports progress.
+    warming = asyncio.create_task(warmup.run(app_id))
+    stop_watcher = note_retriever.start_watcher()
+    async with mcp_lifespan(starlette_app):
+        yield
+    warming.cancel()
+    stop_watcher.set()
+    await math_solver.close()
+
+# Each worker process imports this module and serves this app.
+app = mcp.http_app(transport='streamable-http')
+mcp_lifespan = app.router.lifespan_context
+app.router.lifespan_context = lifespan
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Math Tutor MCP server (streamable HTTP).")
+    parser.add_argument("--host", default=os.getenv("MCP_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MCP_PORT", "8001")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("MCP_WORKERS", "1")),
+                        help="Number of worker processes.")
+    parser.add_argument("--timeout-keep-alive", type=int, default=int(os.getenv("MCP_TIMEOUT_KEEP_ALIVE", "5")),
+                        help="Seconds to hold idle keep-alive connections open.")
+    parser.add_argument("--timeout-graceful-shutdown", type=int,
+                        default=int(os.getenv("MCP_TIMEOUT_GRACEFUL_SHUTDOWN", "30")),
+                        help="Seconds to let in-flight requests finish after SIGTERM/SIGINT.")
+    return parser.parse_args(argv)
 
 def main():
-    mcp.run(transport='streamable-http', host='0.0.0.0', port=8001)
-    # print(note_retriever.get_sections())
+    args = parse_args()
+    # uvicorn needs an import string to spawn more than one worker.
+    uvicorn.run(
+        "server:app" if args.workers > 1 else app,
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_keep_alive=args.timeout_keep_alive,
+        timeout_graceful_shutdown=args.timeout_graceful_shutdown,
+        lifespan="on",
+    )
     
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
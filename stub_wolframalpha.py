@@ -0,0 +1,89 @@
+import argparse
+import random
+import threading
+import time
+from typing import Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers /api/v1/llm-api requests with a canned WolframAlpha LLM API style response."""
+    latency = 0.0
+    error_rate = 0.0
+    error_status = 503
+    # The first fail_first requests are answered with error_status, e.g. to exercise retries.
+    fail_first = 0
+    retry_after = None
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        problem = query.get("input", [""])[0]
+        with self.server.lock:
+            self.server.problems.append(problem)
+            count = len(self.server.problems)
+        if self.latency:
+            time.sleep(self.latency)
+        if count <= self.fail_first or random.random() < self.error_rate:
+            self._reply(self.error_status, "Stub error")
+            return
+        if not problem:
+            self._reply(400, "No input")
+            return
+        self._reply(200, f'Query:\n"{problem}"\n\nInput interpretation:\n{problem}\n\nResult:\n42\n')
+
+    def _reply(self, status: int, text: str):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429 and self.retry_after is not None:
+            self.send_header("Retry-After", str(self.retry_after))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up first, e.g. after its read timeout.
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(host: str = "127.0.0.1", port: int = 8002, latency: float = 0.0, error_rate: float = 0.0,
+          error_status: int = 503, fail_first: int = 0, retry_after: Optional[int] = None) -> ThreadingHTTPServer:
+    """
+    Build a stub WolframAlpha server. Point WOLFRAMALPHA_API_URL at http://host:port/api/v1/llm-api to use it.
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind. 0 picks a free port.
+        latency (float): Seconds to sleep before every response.
+        error_rate (float): Fraction of requests answered with error_status.
+        error_status (int): HTTP status of error responses.
+        fail_first (int): Answer this many requests with error_status before behaving normally.
+        retry_after (Optional[int]): Retry-After header sent with 429 responses.
+
+    Returns:
+        ThreadingHTTPServer: The server; call serve_forever() on it. Its problems attribute lists the
+            input of every request received.
+    """
+    handler = type("ConfiguredStubHandler", (StubHandler,), {
+        "latency": latency, "error_rate": error_rate, "error_status": error_status,
+        "fail_first": fail_first, "retry_after": retry_after})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.lock = threading.Lock()
+    server.problems = []
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub WolframAlpha LLM API for local testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = serve(args.host, args.port, args.latency, args.error_rate)
+    print(f"Stub WolframAlpha listening on http://{args.host}:{args.port}/api/v1/llm-api")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
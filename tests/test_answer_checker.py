@@ -0,0 +1,95 @@
+import csv
+import glob
+import os
+from fractions import Fraction
+import pytest
+import answer_checker
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROWS = [row for path in sorted(glob.glob(os.path.join(ROOT, "benchmark_data", "*.csv")))
+        for row in csv.DictReader(open(path, encoding="utf-8"))]
+CHECKABLE = [row for row in ROWS if answer_checker.expected_values(row["solution"]) is not None]
+
+def tutor(*messages):
+    return [{"role": "tutor", "content": message} for message in messages]
+
+def test_benchmark_has_checkable_solutions():
+    assert len(ROWS) == 160
+    assert len(CHECKABLE) >= 55
+
+@pytest.mark.parametrize("row", CHECKABLE, ids=lambda row: row["solution"][:40])
+def test_expected_solution_restated_is_never_a_mismatch(row):
+    matches, details = answer_checker.check(tutor(f"Great work! The answer is {row['solution'].strip()}"),
+                                            row["solution"], row["question"])
+    assert matches is not False, details
+
+@pytest.mark.parametrize("row", CHECKABLE, ids=lambda row: row["solution"][:40])
+def test_wrong_final_answer_is_a_mismatch(row):
+    wrong = answer_checker.expected_values(row["solution"])[-1].value + 7
+    matches, details = answer_checker.check(tutor(f"So the final answer is {wrong}."), row["solution"], row["question"])
+    assert matches is False, details
+
+def test_most_restated_solutions_match_locally():
+    conclusive = sum(answer_checker.check(tutor(f"The answer is {row['solution'].strip()}"),
+                                          row["solution"], row["question"])[0] is True for row in CHECKABLE)
+    assert conclusive >= 50
+
+@pytest.mark.parametrize("text, value, approximate", [
+    ("1/12", Fraction(1, 12), False),
+    (".0833...", Fraction(833, 10000), True),
+    ("0.3...", Fraction(3, 10), True),
+    ("8.333...%", Fraction(8333, 100000), True),
+    ("$287.50", Fraction(575, 2), False),
+    ("3 5/8", Fraction(29, 8), False),
+    ("940 pounds", Fraction(940), False),
+    ("-2 + 4", Fraction(2), False),
+    ("\\frac{3}{4}", Fraction(3, 4), False),
+    ("≈ 196.3", Fraction(1963, 10), True),
+])
+def test_parse_value(text, value, approximate):
+    parsed = answer_checker.parse_value(text)
+    assert parsed.value == value
+    assert (parsed.tolerance > 0) == approximate
+
+@pytest.mark.parametrize("text", ["-63m + 36", "b = 3s + 1", "x > 4", "(10^100)^100 ^ 100", "(" * 500 + "1" + ")" * 500])
+def test_parse_value_rejects_non_numbers(text):
+    assert answer_checker.parse_value(text) is None
+
+@pytest.mark.parametrize("messages, expected, question, result", [
+    # Repeating decimals and rounding.
+    (["The answer is 0.3... (repeating)."], "1/3", "", True),
+    (["The answer is 0.0833..."], "1/12 = .0833... = 8.333...%", "", True),
+    (["The answer is 8.33%."], "1/12 = .0833... = 8.333...%", "", True),
+    (["The answer is 0.5."], "1/3", "", False),
+    # Only the last answer statement counts.
+    (["First we get 3. So the final answer is 12."], "12", "", True),
+    (["The answer is 12. Let me recheck: the answer is 13."], "12", "", False),
+    # Negation or quoting the student leaves it to the judge.
+    (["Your answer is 1/3, but that is wrong. The correct answer is 2/5."], "1/3", "", None),
+    (["Your answer is 12, let us check that again."], "9/35", "", None),
+    (["You said the answer is 5. Actually x = 9/35 is correct."], "9/35", "", None),
+    (["The answer is not 9/35."], "9/35", "", None),
+    # Unsimplified forms.
+    (["The answer is 3/9, can you simplify it further?"], "1/3", "Simplify 3/9", None),
+    (["The answer is 3/9, or 1/3 in lowest terms."], "1/3", "Simplify 3/9", True),
+    (["The answer is 0.333..."], "1/3", "Simplify 3/9", None),
+    # Weak statements only ever match.
+    (["Great job, **9/35** is right."], "9/35", "", True),
+    (["Great job, **4** is right."], "9/35", "", None),
+    # The last tutor message with an answer decides.
+    (["The answer is 4.", "Keep going, you are nearly done."], "4", "", True),
+    (["The answer is (10^100)^100."], "9/35", "", False),
+    (["Let's think about it step by step."], "9/35", "", None),
+])
+def test_check(messages, expected, question, result):
+    matches, details = answer_checker.check(tutor(*messages), expected, question)
+    assert matches is result, details
+
+def test_check_skips_student_messages_and_errors():
+    log = [{"role": "tutor", "content": "The answer is 7."},
+           {"role": "student", "content": "The answer is 8."},
+           {"role": "tutor", "content": "ERROR: 500"}]
+    assert answer_checker.check(log, "7")[0] is True
+
+def test_prose_solution_is_not_checkable():
+    assert answer_checker.check(tutor("The answer is 4."), "The angles are supplementary")[0] is None
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+import pytest
+import stub_wolframalpha
+from tools import admission
+from tools import math_solver
+from tools import replay
+from tools import solve_cache
+
+@pytest.fixture
+def start_stub():
+    """Start stub WolframAlpha servers on free ports and point math_solver at them."""
+    servers = []
+
+    def start(**options):
+        server = stub_wolframalpha.serve(port=0, **options)
+        threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        servers.append(server)
+        math_solver.API_URL = f"http://127.0.0.1:{server.server_address[1]}/api/v1/llm-api"
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture(autouse=True)
+def solver(monkeypatch):
+    """A fresh, fast-retrying solver with a memory-only cache and no admission limits."""
+    monkeypatch.setattr(replay, "mode", "off")
+    monkeypatch.setattr(math_solver, "API_URL", math_solver.API_URL)
+    monkeypatch.setattr(math_solver, "LOCAL_SOLVER", False)
+    monkeypatch.setattr(math_solver, "MAX_RETRIES", 2)
+    monkeypatch.setattr(math_solver, "RETRY_BACKOFF", 0.01)
+    monkeypatch.setattr(math_solver, "READ_TIMEOUT", 5.0)
+    monkeypatch.setattr(math_solver, "cache", solve_cache.SolveCache(None))
+    monkeypatch.setattr(math_solver, "admission_control", admission.AdmissionControl(0))
+    monkeypatch.setattr(math_solver, "_inflight", {})
+    monkeypatch.setattr(math_solver, "_client", None)
+    monkeypatch.setattr(math_solver, "counters", {"upstream_requests": 0, "coalesced": 0, "local": 0})
+
+def solve(*problems):
+    """Solve problems concurrently on a fresh event loop and close the client before it ends."""
+    async def run():
+        try:
+            return await asyncio.gather(*(math_solver.solve_with_engine(p, "app-id") for p in problems))
+        finally:
+            await math_solver.close()
+    return asyncio.run(run())
+
+def test_answers_from_upstream_then_from_cache(start_stub):
+    stub = start_stub()
+    [(text, engine)] = solve("integrate x^2")
+    assert engine == "wolframalpha"
+    assert "Result:\n42" in text
+    [(cached, engine)] = solve("Integrate  x^2")
+    assert (cached, engine) == (text, "cache")
+    assert stub.problems == ["integrate x^2"]
+
+@pytest.mark.parametrize("status", [500, 503, 429])
+def test_retries_server_errors_and_rate_limits(start_stub, status):
+    stub = start_stub(error_status=status, fail_first=2, retry_after=0)
+    [(text, engine)] = solve("integrate x^2")
+    assert engine == "wolframalpha"
+    assert "Result:\n42" in text
+    assert len(stub.problems) == 3
+
+def test_does_not_retry_client_errors(start_stub):
+    stub = start_stub(error_status=404, fail_first=1)
+    [(text, _)] = solve("integrate x^2")
+    assert text == math_solver.ERROR_RESPONSE
+    assert len(stub.problems) == 1
+
+def test_gives_up_after_max_retries_and_never_caches_the_error(start_stub):
+    stub = start_stub(error_rate=1.0)
+    [(text, engine)] = solve("integrate x^2")
+    assert (text, engine) == (math_solver.ERROR_RESPONSE, "wolframalpha")
+    assert len(stub.problems) == math_solver.MAX_RETRIES + 1
+    [(text, engine)] = solve("integrate x^2")
+    assert engine == "wolframalpha"
+    assert len(stub.problems) == 2 * (math_solver.MAX_RETRIES + 1)
+
+def test_times_out_slow_responses(start_stub, monkeypatch):
+    monkeypatch.setattr(math_solver, "READ_TIMEOUT", 0.05)
+    monkeypatch.setattr(math_solver, "MAX_RETRIES", 1)
+    stub = start_stub(latency=0.5)
+    start = time.perf_counter()
+    [(text, _)] = solve("integrate x^2")
+    assert text == math_solver.ERROR_RESPONSE
+    assert len(stub.problems) == 2
+    assert time.perf_counter() - start < 0.5
+
+def test_coalesces_identical_concurrent_requests(start_stub):
+    stub = start_stub(latency=0.2)
+    results = solve(*(["integrate x^2", "Integrate x^2 ", "`integrate x^2`"] * 4))
+    assert {engine for _, engine in results} == {"wolframalpha"}
+    assert len({text for text, _ in results}) == 1
+    assert stub.problems == ["integrate x^2"]
+    assert math_solver.counters["coalesced"] == 11
+
+def test_rejects_when_busy_instead_of_queueing_past_the_deadline(start_stub, monkeypatch):
+    monkeypatch.setattr(math_solver, "admission_control",
+                        admission.AdmissionControl(rate=1, burst=1, max_queue=8, max_wait=0.5))
+    stub = start_stub()
+    results = solve("integrate x^2", "integrate x^3", "integrate x^4")
+    engines = [engine for _, engine in results]
+    assert engines.count("wolframalpha") == 1
+    assert engines.count("admission") == 2
+    assert all(text.startswith("Error: WolframAlpha is busy") for text, engine in results if engine == "admission")
+    assert len(stub.problems) == 1
+
+def test_rejects_once_the_monthly_quota_is_used(start_stub, monkeypatch):
+    monkeypatch.setattr(math_solver, "admission_control",
+                        admission.AdmissionControl(0, quota=admission.Quota(None, monthly_limit=1)))
+    stub = start_stub()
+    [(_, first), (text, second)] = [solve("integrate x^2")[0], solve("integrate x^3")[0]]
+    assert (first, second) == ("wolframalpha", "admission")
+    assert text.startswith("Error: WolframAlpha monthly quota reached")
+    assert len(stub.problems) == 1
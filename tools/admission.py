@@ -0,0 +1,140 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+from tools import metrics
+
+class Rejected(Exception):
+    """Raised instead of sending a request that would exceed the rate limit, the wait queue or the quota."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+        self.message = message
+
+class Quota:
+    """
+    Upstream requests used per calendar month (UTC), kept in SQLite so the count survives restarts and is
+    shared by every worker using the same file. Without a path the count is kept in memory.
+
+    If SQLite fails (e.g. the file stays locked past the busy timeout) the error is logged and this
+    worker falls back to its own in-memory count for that call. The statements block, so call them
+    from a thread when on an event loop.
+    """
+
+    def __init__(self, path: Optional[str], monthly_limit: int = 0):
+        self.monthly_limit = monthly_limit
+        self._lock = threading.Lock()
+        self._memory: Dict[str, int] = {}
+        self._db = None
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("CREATE TABLE IF NOT EXISTS quota_usage "
+                                 "(period TEXT PRIMARY KEY, used INTEGER NOT NULL)")
+            except sqlite3.Error as e:
+                # Counted in memory instead, so a bad path does not stop the server from starting.
+                metrics.log("quota_error", operation="open", error=repr(e))
+                self._db = None
+
+    @staticmethod
+    def period() -> str:
+        return time.strftime("%Y-%m", time.gmtime())
+
+    def used(self) -> int:
+        period = self.period()
+        with self._lock:
+            if self._db is not None:
+                try:
+                    row = self._db.execute("SELECT used FROM quota_usage WHERE period = ?", (period,)).fetchone()
+                    return max(row[0] if row else 0, self._memory.get(period, 0))
+                except sqlite3.Error as e:
+                    metrics.log("quota_error", operation="used", error=repr(e))
+            return self._memory.get(period, 0)
+
+    def add(self, count: int = 1):
+        period = self.period()
+        with self._lock:
+            # Counted locally too, as the fallback when the file can't be read.
+            self._memory[period] = self._memory.get(period, 0) + count
+            if self._db is None:
+                return
+            try:
+                # A single statement, so concurrent workers never lose an increment.
+                self._db.execute("INSERT INTO quota_usage (period, used) VALUES (?, ?) "
+                                 "ON CONFLICT(period) DO UPDATE SET used = used + excluded.used", (period, count))
+            except sqlite3.Error as e:
+                metrics.log("quota_error", operation="add", error=repr(e))
+
+    def exhausted(self) -> bool:
+        return self.monthly_limit > 0 and self.used() >= self.monthly_limit
+
+class AdmissionControl:
+    """
+    Token bucket in front of an upstream API, with a bounded FIFO wait queue and a wait deadline.
+
+    Requests that would wait longer than max_wait, or arrive while max_queue requests are already waiting,
+    are rejected at once as busy rather than sent and throttled. Each worker process has its own bucket;
+    the quota is shared through its file.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, max_queue: int = 64, max_wait: float = 10,
+                 quota: Optional[Quota] = None):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.quota = quota or Quota(None)
+        # Theoretical arrival time of the next request (GCRA): admitting a request pushes it 1/rate later.
+        self._next = 0.0
+        self.waiting = 0
+        self.counters = {"admitted": 0, "queued": 0, "busy": 0, "quota": 0}
+
+    def _schedule(self, now: float) -> float:
+        """Return how long a request arriving now must wait, without reserving a slot."""
+        return max(0.0, self._next - (self.burst - 1) / self.rate - now)
+
+    async def acquire(self) -> float:
+        """
+        Wait for a slot and count the request against the quota.
+
+        Returns:
+            float: Seconds spent waiting.
+
+        Raises:
+            Rejected: With reason "quota" if the monthly quota is used up, or "busy" if the queue is full
+                or the wait would exceed max_wait.
+        """
+        # Quota reads and writes may hit SQLite, so they run in a thread to keep the event loop free.
+        if await asyncio.to_thread(self.quota.exhausted):
+            self.counters["quota"] += 1
+            raise Rejected("quota", "Error: WolframAlpha monthly quota reached. Try again next month.")
+        wait = 0.0
+        if self.rate > 0:
+            now = time.monotonic()
+            wait = self._schedule(now)
+            if wait > 0 and (self.waiting >= self.max_queue or wait > self.max_wait):
+                self.counters["busy"] += 1
+                raise Rejected("busy", f"Error: WolframAlpha is busy. Try again in {max(1, round(wait))} seconds.")
+            # Reserve the slot before sleeping so later arrivals queue behind this one.
+            self._next = max(self._next, now) + 1 / self.rate
+            if wait > 0:
+                self.counters["queued"] += 1
+                self.waiting += 1
+                try:
+                    await asyncio.sleep(wait)
+                finally:
+                    self.waiting -= 1
+        self.counters["admitted"] += 1
+        await asyncio.to_thread(self.quota.add)
+        return wait
+
+    def pause(self, seconds: float):
+        """Hold back every request for the next seconds, e.g. after the upstream answered 429 with Retry-After."""
+        if self.rate > 0:
+            self._next = max(self._next, time.monotonic() + seconds + (self.burst - 1) / self.rate)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.counters, waiting=self.waiting)
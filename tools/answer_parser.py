@@ -0,0 +1,124 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# A pod header is a short "Label:" line at the start of the text or after a blank line.
+_HEADER = re.compile(r"^([A-Z][^:\n]{0,80}):$")
+_WEBSITE = re.compile(r"^Wolfram\|Alpha website result for ")
+
+_INTERPRETATION_PODS = ("Input interpretation", "Input")
+_RESULT_PODS = ("Result", "Results", "Exact result", "Solution", "Solutions", "Real solution", "Real solutions",
+                "Integer solution", "Integer solutions", "Complex solution", "Complex solutions", "Value")
+_DECIMAL_PODS = ("Decimal approximation", "Decimal form", "Repeating decimal", "Approximate form")
+_ALTERNATE_PODS = ("Alternate form", "Alternate forms", "Mixed fraction", "Percentage", "Fraction form")
+
+@dataclass
+class Answer:
+    """The parts of a WolframAlpha LLM API answer the tutor uses."""
+    query: Optional[str] = None
+    interpretation: Optional[str] = None
+    result: Optional[str] = None
+    exact: Optional[str] = None
+    decimal: Optional[str] = None
+    alternate_forms: List[str] = field(default_factory=list)
+    # Every text pod by label, in response order.
+    pods: Dict[str, str] = field(default_factory=dict)
+
+def _pods(text: str) -> List[Tuple[str, str]]:
+    """Return (label, value) for every text pod, in response order."""
+    pods: List[Tuple[str, List[str]]] = []
+    previous_blank = True
+    for line in text.splitlines():
+        line = line.rstrip()
+        match = _HEADER.match(line)
+        if match and previous_blank:
+            pods.append((match.group(1), []))
+        elif pods:
+            pods[-1][1].append(line)
+        previous_blank = not line
+    parsed = []
+    for label, lines in pods:
+        if _WEBSITE.match(label):
+            continue
+        # Keep text only: drop image links and Wolfram Language code lines.
+        lines = [l for l in lines if not l.startswith(("image:", "Wolfram Language code:", "https://"))]
+        value = re.sub(r"\n{3,}", "\n\n", "\n".join(lines).strip())
+        if value:
+            parsed.append((label, value))
+    return parsed
+
+def _first(pods: Dict[str, str], labels) -> Optional[str]:
+    for label in labels:
+        if label in pods:
+            return pods[label]
+    # Labels like "Alternate form assuming x is real" or "Result for x > 0".
+    for label in labels:
+        for name, value in pods.items():
+            if name.startswith(label + " "):
+                return value
+    return None
+
+def _is_approximate(value: str) -> bool:
+    return "≈" in value or value.rstrip().endswith("...")
+
+def parse(text: str) -> Answer:
+    """
+    Split a WolframAlpha LLM API (or local solver) answer into its pods.
+
+    Args:
+        text (str): The answer text, laid out as "Label:\\nvalue" blocks separated by blank lines.
+
+    Returns:
+        Answer: The parsed answer. Fields the response does not contain are None or empty.
+    """
+    found = _pods(text)
+    pods: Dict[str, str] = {}
+    for label, value in found:
+        # Repeated labels (e.g. several "Alternate form" pods) are merged.
+        pods[label] = f"{pods[label]}\n\n{value}" if label in pods else value
+    answer = Answer(pods=pods)
+    query = pods.get("Query")
+    answer.query = query.strip('"') if query else None
+    answer.interpretation = _first(pods, _INTERPRETATION_PODS)
+    answer.result = _first(pods, _RESULT_PODS)
+    answer.decimal = _first(pods, _DECIMAL_PODS)
+    answer.exact = pods.get("Exact result")
+    if answer.result is None:
+        # E.g. "pi" has only a decimal approximation.
+        answer.result = answer.decimal
+    if answer.result is not None:
+        if answer.exact is None and not _is_approximate(answer.result):
+            answer.exact = answer.result
+        if answer.decimal is None and _is_approximate(answer.result):
+            answer.decimal = answer.result
+    answer.alternate_forms = [value for label, value in found
+                              if any(label == name or label.startswith(name + " ") for name in _ALTERNATE_PODS)]
+    return answer
+
+def _inline(value: str) -> str:
+    """Put a multi-line pod (e.g. several solutions) on one line."""
+    return "; ".join(line.strip() for line in value.splitlines() if line.strip())
+
+def compact(text: str) -> str:
+    """
+    Shorten an answer to the lines the tutor needs: interpretation, result, and exact/decimal values that
+    differ from the result. Falls back to the original text if no result pod is found.
+
+    Args:
+        text (str): The answer text.
+
+    Returns:
+        str: E.g. "Input: solve 2 x + 3 = 7\\nResult: x = 2".
+    """
+    answer = parse(text)
+    if answer.result is None:
+        return text
+    lines = []
+    if answer.interpretation:
+        lines.append(f"Input: {_inline(answer.interpretation)}")
+    lines.append(f"Result: {_inline(answer.result)}")
+    if answer.exact and answer.exact != answer.result:
+        lines.append(f"Exact: {_inline(answer.exact)}")
+    if answer.decimal and answer.decimal != answer.result:
+        lines.append(f"Decimal: {_inline(answer.decimal)}")
+    return "\n".join(lines)
@@ -0,0 +1,235 @@
+import re
+from typing import Optional, Tuple
+
+try:
+    import sympy
+    from sympy.parsing.sympy_parser import (
+        convert_xor, implicit_multiplication_application, parse_expr, rationalize, standard_transformations,
+    )
+    from sympy.printing.str import StrPrinter
+except ImportError:  # sympy is optional; without it every problem goes to WolframAlpha
+    sympy = None
+    StrPrinter = object
+
+# Only plain math notation is handed to the sympy parser, which evaluates its input.
+_ALLOWED = re.compile(r"^[0-9a-z+\-*/^().,=<>|%\s]*$")
+_FUNCTIONS = {"sqrt", "abs", "pi"}
+_MAX_NUMBER = 10 ** 12
+_MAX_EXPONENT = 100
+
+_COMMAND = re.compile(r"^(?:solve(?: for [a-z])?|simplify|evaluate|compute|calculate|what is|find)\s+(.*)$")
+_CONVERT = re.compile(r"^(?:convert\s+|write\s+)?(.*?)\s+(?:as|to|in|into)\s+(?:an?\s+)?"
+                      r"(percent|percentage|decimal|fraction)(?: form)?$")
+_PERCENT_OF = re.compile(r"(\d+(?:\.\d+)?)\s*%\s*of\s+")
+_PERCENT = re.compile(r"(\d+(?:\.\d+)?)\s*%")
+_MAX_DEGREE = 4
+_COMPLEX = sympy.Symbol("z") if sympy else None
+_MAX_LENGTH = 200
+
+def available() -> bool:
+    """Return True if the local engine can run (sympy is installed)."""
+    return sympy is not None
+
+def _parse(text: str):
+    text = text.replace("|", " | ")
+    # |x| -> abs(x); only handles non-nested bars, which covers the curriculum.
+    text = re.sub(r"\|\s*([^|]+?)\s*\|", r"abs(\1)", text)
+    for word in re.findall(r"[a-z]{2,}", text):
+        if word not in _FUNCTIONS:
+            raise ValueError(f"unsupported word {word!r}")
+    # P(9), f(3): function notation, not multiplication.
+    if re.search(r"(?<![a-z])[a-z]\(", text):
+        raise ValueError("function notation")
+    transformations = standard_transformations + (implicit_multiplication_application, convert_xor, rationalize)
+    local_dict = {name: sympy.Symbol(name, real=True) for name in set(re.findall(r"[a-z]", text))}
+    local_dict.update({"sqrt": sympy.sqrt, "abs": sympy.Abs, "pi": sympy.pi, "e": sympy.E, "i": sympy.I})
+    expr = parse_expr(text, local_dict=local_dict, transformations=transformations, evaluate=False)
+    _check_size(expr)
+    return expr
+
+def _check_size(expr):
+    """Refuse inputs like 9^9^9 that would take sympy too long to evaluate exactly."""
+    for node in sympy.preorder_traversal(expr):
+        if node.is_Number and abs(node) > _MAX_NUMBER:
+            raise ValueError("number too large")
+        if node.is_Pow and node.exp.is_Number and abs(node.exp) > _MAX_EXPONENT:
+            raise ValueError("exponent too large")
+        if node.is_Pow and not node.exp.is_Number and node.exp.has(sympy.Pow):
+            raise ValueError("nested exponent")
+
+def _decimal(value) -> Optional[str]:
+    if not value.is_number or not value.is_real:
+        return None
+    if value.is_Rational:
+        denominator = value.q
+        while denominator % 2 == 0:
+            denominator //= 2
+        while denominator % 5 == 0:
+            denominator //= 5
+        if denominator == 1:
+            return _trim(sympy.N(value, 30))
+    return _trim(sympy.N(value, 15)) + "..."
+
+class _MathPrinter(StrPrinter):
+    """Print results in the LLM API's notation: x^2, 5x, 2 sqrt(2), e^2, 2i, |x|, -2 < x < 2."""
+
+    def _print_Pow(self, expr, rational=False):
+        return super()._print_Pow(expr, rational).replace("**", "^")
+
+    def _print_Mul(self, expr):
+        text = super()._print_Mul(expr)
+        text = re.sub(r"\*(?=[a-z]{2,}\()", " ", text)
+        text = re.sub(r"(?<=\d)\*(?=\d)", " × ", text)
+        text = re.sub(r"(?<=[\d)])\*(?=[a-zA-Zπ(|])", "", text)
+        return text.replace("*", " ")
+
+    def _print_exp(self, expr):
+        exponent = self._print(expr.args[0])
+        return f"e^{exponent}" if expr.args[0].is_Atom else f"e^({exponent})"
+
+    def _print_Exp1(self, expr):
+        return "e"
+
+    def _print_ImaginaryUnit(self, expr):
+        return "i"
+
+    def _print_Pi(self, expr):
+        return "π"
+
+    def _print_Abs(self, expr):
+        return f"|{self._print(expr.args[0])}|"
+
+    def _print_Relational(self, expr):
+        return f"{self._print(expr.lhs)} {expr.rel_op} {self._print(expr.rhs)}"
+
+    def _print_And(self, expr):
+        if len(expr.args) == 2 and all(isinstance(a, sympy.core.relational.Relational) for a in expr.args):
+            first, second = expr.args
+            if first.rhs == second.lhs:
+                return f"{self._print(first)} {second.rel_op} {self._print(second.rhs)}"
+            if second.rhs == first.lhs:
+                return f"{self._print(second)} {first.rel_op} {self._print(first.rhs)}"
+        return " and ".join(self._print(a) for a in expr.args)
+
+    def _print_Or(self, expr):
+        return " or ".join(self._print(a) for a in expr.args)
+
+def _text(expr) -> str:
+    return _MathPrinter().doprint(expr)
+
+def _trim(number) -> str:
+    return f"{float(number):.15g}" if abs(number) < 1e15 else str(number)
+
+def _format(query: str, interpretation: str, result: str, *extra: Tuple[str, Optional[str]]) -> str:
+    """Lay out an answer the way the WolframAlpha LLM API does, skipping empty extra pods."""
+    parts = [f'Query:\n"{query}"', f"Input interpretation:\n{interpretation}", f"Result:\n{result}"]
+    parts.extend(f"{label}:\n{value}" for label, value in extra if value and value != result)
+    return "\n\n".join(parts)
+
+def _undefined(expr) -> bool:
+    """True if expr divides by zero somewhere (x/0, 1/(2 - 2)) or is already zoo/nan."""
+    if expr.has(sympy.zoo, sympy.nan):
+        return True
+    return any(node.is_Pow and node.exp.is_negative and sympy.simplify(node.base).is_zero
+               for node in sympy.preorder_traversal(expr))
+
+def _solve_expression(query: str, text: str) -> Optional[str]:
+    expr = _parse(text)
+    if isinstance(expr, sympy.core.relational.Relational):
+        return _solve_relation(query, text, expr)
+    value = sympy.simplify(expr)
+    if _undefined(expr) or _undefined(value):
+        return None
+    if value.free_symbols:
+        return _format(query, f"simplify {text}", _text(value))
+    if not value.is_number:
+        return None
+    return _format(query, text, _text(value), ("Decimal approximation", _decimal(value)))
+
+def _solve_relation(query: str, text: str, relation) -> Optional[str]:
+    symbols = relation.free_symbols
+    # The variable is real, so anything involving i is left to WolframAlpha.
+    if len(symbols) != 1 or _undefined(relation) or relation.has(sympy.I):
+        return None
+    symbol = symbols.pop()
+    difference = sympy.simplify(relation.lhs - relation.rhs)
+    if _undefined(difference):
+        return None
+    if not difference.free_symbols:
+        # The variable cancels (2(x+1) = 2x + 2, x > x + 1): true for every x or for none.
+        holds = relation.func(difference, 0)
+        if holds is sympy.true:
+            many = "; infinitely many solutions" if isinstance(relation, sympy.Equality) else ""
+            return _format(query, f"solve {text}", f"{symbol} ∈ ℝ (all real numbers{many})")
+        if holds is sympy.false:
+            return _format(query, f"solve {text}", "(no solutions exist)")
+        return None
+    if difference.is_polynomial(symbol) and sympy.degree(difference, symbol) > _MAX_DEGREE:
+        return None
+    if isinstance(relation, sympy.Equality):
+        solutions = sympy.solve(relation, symbol)
+        # An empty list may just mean sympy could not decide, except for polynomials, which always have
+        # complex roots: WolframAlpha answers those with the complex solutions, so leave them to it.
+        if not difference.is_polynomial(symbol):
+            if not solutions:
+                return None
+        elif len(sympy.solve(difference.subs(symbol, _COMPLEX), _COMPLEX)) > len(solutions):
+            return None
+        results = [f"{symbol} = {_text(solution)}" for solution in solutions]
+        decimals = [f"{symbol} ≈ {_decimal(s)}" for s in solutions if (_decimal(s) or "").endswith("...")]
+        return _format(query, f"solve {text}", "\n\n".join(results),
+                       ("Decimal approximation", "\n\n".join(decimals)))
+    solution = sympy.solve_univariate_inequality(relation, symbol, relational=True)
+    if solution is sympy.true:
+        return _format(query, f"solve {text}", f"{symbol} ∈ ℝ (all real numbers)")
+    if solution is sympy.false:
+        return _format(query, f"solve {text}", "(no solutions exist)")
+    if isinstance(solution, sympy.core.relational.Relational) and solution.lhs.is_number:
+        solution = solution.reversed
+    return _format(query, f"solve {text}", _text(solution))
+
+def _convert(query: str, text: str, target: str) -> Optional[str]:
+    value = sympy.nsimplify(sympy.simplify(_parse(text)), rational=True)
+    if not value.is_Rational:
+        return None
+    if target in ("percent", "percentage"):
+        percent = value * 100
+        return _format(query, f"convert {text} to percent", f"{_decimal(percent)}%",
+                       ("Exact result", f"{_text(percent)}%"))
+    if target == "decimal":
+        return _format(query, f"convert {text} to decimal", _decimal(value))
+    return _format(query, f"convert {text} to fraction", _text(value))
+
+def solve(problem: str) -> Optional[str]:
+    """
+    Solve arithmetic, fraction, percent conversion and single-variable equation problems offline.
+
+    Args:
+        problem (str): The math problem to solve.
+
+    Returns:
+        Optional[str]: An answer laid out like the WolframAlpha LLM API, or None if the problem is out of scope.
+    """
+    if sympy is None:
+        return None
+    query = problem.strip().strip('`').strip()
+    text = query.lower().rstrip("?. ").replace("−", "-").replace("×", "*").replace("÷", "/")
+    text = _PERCENT_OF.sub(r"(\1/100)*", text)
+    text = _PERCENT.sub(r"(\1/100)", text)
+    try:
+        match = _CONVERT.match(text)
+        if match and len(text) <= _MAX_LENGTH and _ALLOWED.match(match.group(1)):
+            return _convert(query, match.group(1), match.group(2))
+        match = _COMMAND.match(text)
+        if match:
+            text = match.group(1)
+        if not text or len(text) > _MAX_LENGTH or not _ALLOWED.match(text):
+            return None
+        if "=" in text and not re.search(r"[<>!]=|==", text):
+            lhs, _, rhs = text.partition("=")
+            if "=" in rhs:
+                return None
+            return _solve_relation(query, text, sympy.Eq(_parse(lhs), _parse(rhs), evaluate=False))
+        return _solve_expression(query, text)
+    except Exception:
+        return None
@@ -1,22 +1,255 @@
-import requests
+import asyncio
+import random
+import time
+from typing import Dict, Tuple
+import httpx
 from dotenv import load_dotenv
 import os
+from tools import admission
+from tools import answer_parser
+from tools import local_solver
+from tools import metrics
+from tools import replay
+from tools import solve_cache
 
-def solve(problem: str, app_id: str) -> str:
-    api_url = "https://www.wolframalpha.com/api/v1/llm-api"
+API_URL = os.getenv("WOLFRAMALPHA_API_URL", "https://www.wolframalpha.com/api/v1/llm-api")
+CONNECT_TIMEOUT = float(os.getenv("WOLFRAMALPHA_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("WOLFRAMALPHA_READ_TIMEOUT", "20"))
+MAX_RETRIES = int(os.getenv("WOLFRAMALPHA_MAX_RETRIES", "2"))
+RETRY_BACKOFF = float(os.getenv("WOLFRAMALPHA_RETRY_BACKOFF", "0.5"))
+MAX_CONNECTIONS = int(os.getenv("WOLFRAMALPHA_MAX_CONNECTIONS", "20"))
+LOCAL_SOLVER = os.getenv("LOCAL_SOLVER", "1") not in ("0", "false", "False")
+# Default for solve_math's compact flag, so clients that never pass it (e.g. the Dify workflow) can get short answers.
+COMPACT_DEFAULT = os.getenv("SOLVE_MATH_COMPACT", "0") not in ("0", "false", "False")
+CACHE_PATH = os.getenv("SOLVE_CACHE_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "solve_cache.sqlite3"))
+CACHE_SIZE = int(os.getenv("SOLVE_CACHE_SIZE", "1024"))
+CACHE_TTL = float(os.getenv("SOLVE_CACHE_TTL", "3600"))
+CACHE_DISK_TTL = float(os.getenv("SOLVE_CACHE_DISK_TTL", str(30 * 24 * 3600)))
+# Match these to the app id's plan. RATE_LIMIT is requests per second per worker (0 = unlimited).
+RATE_LIMIT = float(os.getenv("WOLFRAMALPHA_RATE_LIMIT", "5"))
+RATE_BURST = int(os.getenv("WOLFRAMALPHA_RATE_BURST", "10"))
+QUEUE_SIZE = int(os.getenv("WOLFRAMALPHA_QUEUE_SIZE", "64"))
+QUEUE_TIMEOUT = float(os.getenv("WOLFRAMALPHA_QUEUE_TIMEOUT", "10"))
+MONTHLY_QUOTA = int(os.getenv("WOLFRAMALPHA_MONTHLY_QUOTA", "0"))
+# Usage is counted in the cache file by default; an empty path counts in memory only.
+QUOTA_PATH = os.getenv("WOLFRAMALPHA_QUOTA_PATH", CACHE_PATH)
+
+ERROR_RESPONSE = "Error: Unable to reach WolframAlpha API."
+
+_client: httpx.AsyncClient = None
+# An empty SOLVE_CACHE_PATH keeps the cache in memory only.
+cache = solve_cache.SolveCache(CACHE_PATH or None, CACHE_SIZE, CACHE_TTL, CACHE_DISK_TTL)
+# Upstream requests in flight, keyed by normalized problem, so identical concurrent calls share one.
+_inflight: Dict[str, asyncio.Task] = {}
+admission_control = admission.AdmissionControl(RATE_LIMIT, RATE_BURST, QUEUE_SIZE, QUEUE_TIMEOUT,
+                                               admission.Quota(QUOTA_PATH or None, MONTHLY_QUOTA))
+counters = {"upstream_requests": 0, "coalesced": 0, "local": 0}
+
+upstream_latency = metrics.histogram("wolframalpha_request_latency_seconds",
+                                     "WolframAlpha LLM API request latency in seconds, per attempt.")
+upstream_responses = metrics.counter("wolframalpha_responses_total",
+                                     "WolframAlpha LLM API responses by HTTP status ('error' for transport failures).")
+metrics.callback("solve_cache_events_total", "solve_math cache lookups and stores by outcome.",
+                 lambda: {(("event", k),): v for k, v in cache.stats().items() if k != "memory_entries"}, "counter")
+metrics.callback("solve_cache_memory_entries", "Entries in the in-process solve_math cache.",
+                 lambda: {(): cache.stats()["memory_entries"]})
+metrics.callback("solve_math_events_total", "solve_math upstream requests, coalesced calls and local answers.",
+                 lambda: {(("event", k),): v for k, v in counters.items()}, "counter")
+admission_wait = metrics.histogram("wolframalpha_admission_wait_seconds",
+                                   "Time WolframAlpha requests waited for a rate limit slot.")
+metrics.callback("wolframalpha_admission_total", "WolframAlpha requests by admission outcome.",
+                 lambda: {(("outcome", k),): v for k, v in admission_control.stats().items() if k != "waiting"},
+                 "counter")
+metrics.callback("wolframalpha_admission_waiting", "WolframAlpha requests waiting for a rate limit slot.",
+                 lambda: {(): admission_control.waiting})
+metrics.callback("wolframalpha_quota_used", "WolframAlpha requests sent this calendar month (all workers).",
+                 lambda: {(): admission_control.quota.used()})
+
+def is_error(text: str) -> bool:
+    """True for the error answers solve returns instead of a solution (unreachable, busy, out of quota)."""
+    return text.startswith("Error:")
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared keep-alive client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+        )
+    return _client
+
+async def close():
+    """Close the shared client and its pooled connections."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def prime(connections: int = 1) -> int:
+    """
+    Open keep-alive connections to the WolframAlpha host (DNS, TCP and TLS) ahead of the first solve_math.
+
+    Sends a HEAD without an app id, so no query is spent. Does nothing in replay mode.
+
+    Args:
+        connections (int): Connections to open concurrently, at most MAX_CONNECTIONS.
+
+    Returns:
+        int: The number of connections that got a response.
+    """
+    if replay.mode == "replay":
+        return 0
+    client = get_client()
+
+    async def touch() -> bool:
+        try:
+            await client.head(API_URL)
+            return True
+        except httpx.HTTPError:
+            return False
+
+    return sum(await asyncio.gather(*(touch() for _ in range(min(connections, MAX_CONNECTIONS)))))
+
+def _retryable(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+def _backoff(attempt: int, retry_after: str = None) -> float:
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), READ_TIMEOUT)
+    # Full jitter: uniform in [0, base * 2^attempt]
+    return random.uniform(0, RETRY_BACKOFF * (2 ** attempt))
+
+async def _fetch(problem: str, app_id: str) -> str:
+    """
+    Query the API, retrying 429/5xx and transport errors. Returns None if no 200 response arrived.
+
+    Every attempt goes through admission control and may raise admission.Rejected.
+    """
     params = {
-        "appid": app_id,
-        "input": problem.strip(r'`'),
+        "input": problem,
         "maxchars": 1000,
     }
-    response = requests.get(api_url, params=params)
-    if response.status_code != 200:
-        print(response.text)
-        return "Error: Unable to reach WolframAlpha API."
-    
-    return response.text
+    client = get_client()
+
+    async def get() -> Dict:
+        response = await client.get(API_URL, params={"appid": app_id, **params})
+        return {"status_code": response.status_code, "text": response.text,
+                "retry_after": response.headers.get("Retry-After")}
+
+    for attempt in range(MAX_RETRIES + 1):
+        if replay.mode != "replay":
+            admission_wait.observe(await admission_control.acquire())
+        start = time.perf_counter()
+        try:
+            # The app id is left out of the recorded request so fixtures can be shared.
+            response = await replay.acall("wolframalpha", params, get)
+        except (httpx.HTTPError, replay.ReplayedError) as e:
+            upstream_latency.observe(time.perf_counter() - start)
+            upstream_responses.inc(status="error")
+            metrics.log("wolframalpha_error", attempt=attempt, error=repr(e))
+            if attempt == MAX_RETRIES:
+                return None
+            await asyncio.sleep(_backoff(attempt))
+            continue
+        elapsed = time.perf_counter() - start
+        upstream_latency.observe(elapsed)
+        upstream_responses.inc(status=response["status_code"])
+        metrics.log("wolframalpha_request", attempt=attempt, status=response["status_code"],
+                    duration_ms=round(elapsed * 1000, 3), response_bytes=len(response["text"].encode("utf-8")))
+        if response["status_code"] == 200:
+            return response["text"]
+        metrics.log("wolframalpha_error", attempt=attempt, status=response["status_code"], body=response["text"][:500])
+        if response["status_code"] == 429:
+            # Hold back every queued request, not just this retry.
+            admission_control.pause(_backoff(attempt, response["retry_after"]))
+        if not _retryable(response["status_code"]) or attempt == MAX_RETRIES:
+            return None
+        await asyncio.sleep(_backoff(attempt, response["retry_after"]))
+    return None
+
+async def _fetch_and_store(key: str, problem: str, app_id: str) -> str:
+    counters["upstream_requests"] += 1
+    text = await _fetch(problem, app_id)
+    if text is not None:
+        await cache.aset(key, text)
+    return text
+
+def _forget(key: str, task: asyncio.Task):
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled():
+        # Mark the exception as retrieved even if every waiter has gone away.
+        task.exception()
+
+async def _fetch_shared(key: str, problem: str, app_id: str) -> str:
+    """Join the in-flight request for key, or start one. Cancelling one waiter does not cancel the others."""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_and_store(key, problem, app_id))
+        _inflight[key] = task
+        task.add_done_callback(lambda done: _forget(key, done))
+    else:
+        counters["coalesced"] += 1
+    return await asyncio.shield(task)
+
+async def solve_with_engine(problem: str, app_id: str) -> Tuple[str, str]:
+    """
+    Solve a math problem, trying the offline engine before the WolframAlpha LLM API.
+
+    WolframAlpha answers are cached under the normalized problem text; error responses are never cached.
+    Concurrent calls for the same normalized problem share a single upstream request. When admission
+    control turns a request away the answer is an explicit busy or quota error from the "admission" engine.
+
+    Args:
+        problem (str): The math problem to solve.
+        app_id (str): The WolframAlpha app ID.
+
+    Returns:
+        Tuple[str, str]: The answer text and the engine that produced it: "local", "cache", "wolframalpha"
+            or "admission".
+    """
+    if LOCAL_SOLVER:
+        # sympy is CPU bound; keep it off the event loop.
+        text = await asyncio.to_thread(local_solver.solve, problem)
+        if text is not None:
+            counters["local"] += 1
+            return text, "local"
+    key = solve_cache.normalize(problem)
+    cached = await cache.aget(key)
+    if cached is not None:
+        return cached, "cache"
+    try:
+        text = await _fetch_shared(key, problem.strip(r'`'), app_id)
+    except admission.Rejected as e:
+        metrics.log("solve_math_rejected", reason=e.reason)
+        return e.message, "admission"
+    if text is None:
+        return ERROR_RESPONSE, "wolframalpha"
+    return text, "wolframalpha"
+
+async def solve(problem: str, app_id: str, show_engine: bool = False, compact: bool = False) -> str:
+    """
+    Solve a math problem. See solve_with_engine.
+
+    Args:
+        problem (str): The math problem to solve.
+        app_id (str): The WolframAlpha app ID.
+        show_engine (bool): Append an "Engine:" line naming the engine that answered.
+        compact (bool): Return only the interpretation, result and exact/decimal values (see answer_parser).
+
+    Returns:
+        str: The answer text, or an error message.
+    """
+    text, engine = await solve_with_engine(problem, app_id)
+    metrics.log("solve_math_engine", engine=engine)
+    if compact and not is_error(text):
+        text = answer_parser.compact(text)
+    if show_engine:
+        return f"{text}\n\nEngine:\n{engine}"
+    return text
 
 # Example usage:
 if __name__ == "__main__":
     load_dotenv()
-    print(solve("solve |2x+3|=5", app_id=os.getenv("WOLFRAMALPHA_APP_ID")))
\ No newline at end of file
+    print(asyncio.run(solve("solve |2x+3|=5", app_id=os.getenv("WOLFRAMALPHA_APP_ID"))))
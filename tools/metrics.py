@@ -0,0 +1,183 @@
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("math_tutor")
+
+# Id of the tool call being served, so logs from the tools can be tied back to it.
+request_id: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (64, 256, 1024, 2048, 4096, 8192, 16384, 65536, 262144)
+QUANTILES = (0.5, 0.95, 0.99)
+# Quantiles are computed over this many recent observations per label set.
+WINDOW = 1024
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _labels(**labels) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(labels: Labels, **extra) -> str:
+    pairs = list(labels) + [(k, str(v)) for k, v in extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels(**labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines.extend(f"{self.name}{_format_labels(k)} {v:g}" for k, v in sorted(self._values.items()))
+        return lines
+
+class CallbackGauge:
+    """A metric whose values are read from fn() at scrape time, e.g. counters kept by another module."""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Dict[Labels, float]], kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{self.name}{_format_labels(k)} {v:g}" for k, v in sorted(self.fn().items()))
+        return lines
+
+class Histogram:
+    """Cumulative buckets plus p50/p95/p99 over a sliding window of recent observations."""
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series: Dict[Labels, dict] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _labels(**labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0, "recent": deque(maxlen=WINDOW)}
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+            series["recent"].append(value)
+
+    def quantiles(self, **labels) -> Dict[float, float]:
+        with self._lock:
+            series = self._series.get(_labels(**labels))
+            recent = sorted(series["recent"]) if series else []
+        return {q: _quantile(recent, q) for q in QUANTILES} if recent else {}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        summary = [f"# HELP {self.name}_recent {self.help} (last {WINDOW} observations)",
+                   f"# TYPE {self.name}_recent summary"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series["counts"]):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, le=f'{bound:g}')} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, le='+Inf')} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']:g}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+                recent = sorted(series["recent"])
+                for q in QUANTILES:
+                    summary.append(f"{self.name}_recent{_format_labels(key, quantile=q)} {_quantile(recent, q):g}")
+        return lines + summary
+
+def _quantile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+_registry: List = []
+
+def counter(name: str, help: str) -> Counter:
+    metric = Counter(name, help)
+    _registry.append(metric)
+    return metric
+
+def histogram(name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+    metric = Histogram(name, help, buckets)
+    _registry.append(metric)
+    return metric
+
+def callback(name: str, help: str, fn: Callable[[], Dict[Labels, float]], kind: str = "gauge") -> CallbackGauge:
+    metric = CallbackGauge(name, help, fn, kind)
+    _registry.append(metric)
+    return metric
+
+def render() -> str:
+    """Render every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+tool_calls = counter("mcp_tool_calls_total", "MCP tool calls.")
+tool_errors = counter("mcp_tool_errors_total", "MCP tool calls that raised or returned an error.")
+tool_latency = histogram("mcp_tool_latency_seconds", "MCP tool call latency in seconds.")
+tool_response_bytes = histogram("mcp_tool_response_bytes", "MCP tool response payload size in bytes.", SIZE_BUCKETS)
+
+def log(event: str, **fields):
+    """Emit one structured JSON log line tagged with the current request id."""
+    logger.info(json.dumps({"event": event, "request_id": request_id.get(), **fields}, default=str))
+
+class ToolCall:
+    def __init__(self, tool: str):
+        self.tool = tool
+        self.request_id = uuid.uuid4().hex[:12]
+        self.error = False
+        self.size: Optional[int] = None
+
+    def result(self, value, error: bool = False):
+        """Record the payload size (and whether it is an error) of value, then return it."""
+        self.error = error
+        self.size = len(value.encode("utf-8")) if isinstance(value, str) else len(json.dumps(value, default=str))
+        return value
+
+@contextlib.contextmanager
+def tool_call(tool: str):
+    """Time a tool call, count it and its errors, and log it with a fresh request id."""
+    call = ToolCall(tool)
+    token = request_id.set(call.request_id)
+    start = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        call.error = True
+        log("tool_error", tool=tool, error=repr(e))
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        tool_calls.inc(tool=tool)
+        if call.error:
+            tool_errors.inc(tool=tool)
+        tool_latency.observe(elapsed, tool=tool)
+        if call.size is not None:
+            tool_response_bytes.observe(call.size, tool=tool)
+        log("tool_call", tool=tool, duration_ms=round(elapsed * 1000, 3), error=call.error, response_bytes=call.size)
+        request_id.reset(token)
@@ -1,61 +1,282 @@
 import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+from tools import metrics
 
-def retrieve(grade: str, section: str) -> str:
+# Notes live next to the tools package, so lookups do not depend on the process cwd.
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+RELOAD_INTERVAL = float(os.getenv("NOTES_RELOAD_INTERVAL", "2"))
+# Rough token estimate used for retrieval budgets.
+CHARS_PER_TOKEN = 4
+
+@dataclass
+class Section:
+    grade: str
+    module: str
+    section_id: str
+    path: str
+    mtime_ns: int
+    size: int
+    text: str
+    title: str
+    # Text before the first "###" heading, then (heading, text) for each "###" subsection
+    header: str
+    subsections: List[Tuple[str, str]]
+
+_corpus: Dict[Tuple[str, str], Section] = {}
+_lock = threading.Lock()
+_versions: Dict[str, int] = {}
+_catalogs: Dict[str, Tuple[int, List[Dict]]] = {}
+_listeners: List[Callable[[str, str, Optional[Section]], None]] = []
+_loaded = False
+_watcher: Optional[threading.Thread] = None
+
+file_reads = metrics.counter("notes_file_reads_total", "Notes files read from disk.")
+file_read_bytes = metrics.counter("notes_file_read_bytes_total", "Bytes of notes read from disk.")
+catalog_lookups = metrics.counter("notes_catalog_lookups_total", "Section catalog lookups by cache result.")
+metrics.callback("notes_sections_loaded", "Sections held in the in-memory notes corpus.", lambda: {(): len(_corpus)})
+
+def _scan(data_dir: str):
+    """Yield (grade, module, section_id, path, stat) for every section file under data_dir."""
+    for grade in os.listdir(data_dir):
+        grade_path = os.path.join(data_dir, grade)
+        if not os.path.isdir(grade_path):
+            continue
+        for module in os.listdir(grade_path):
+            module_path = os.path.join(grade_path, module)
+            if not module.startswith('module') or not os.path.isdir(module_path):
+                continue
+            for filename in os.listdir(module_path):
+                if filename.startswith('section') and filename.endswith('.txt'):
+                    section_id = filename[len('section'):-len('.txt')]
+                    file_path = os.path.join(module_path, filename)
+                    try:
+                        yield grade, module, section_id, file_path, os.stat(file_path)
+                    except OSError:
+                        continue
+
+def _read_section(grade: str, module: str, section_id: str, file_path: str, stat) -> Optional[Section]:
+    try:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            text = file.read()
+    except OSError as e:
+        metrics.log("notes_read_error", path=file_path, error=repr(e))
+        return None
+    file_reads.inc()
+    file_read_bytes.inc(stat.st_size)
+    # First line looks like "## Section 1.1: Title"
+    first_line = text.split('\n', 1)[0].strip()
+    title = first_line.split(': ', 1)[1] if ': ' in first_line else ""
+    header, subsections = _split_subsections(text)
+    return Section(grade, module, section_id, file_path, stat.st_mtime_ns, stat.st_size, text, title,
+                   header, subsections)
+
+def canonical_heading(heading: str) -> str:
+    """
+    Map the spellings used across the notes to one name, e.g. "Concepts and Skills to Master:" and
+    "Concepts and Skills to be Mastered (from standards)" both become "Concepts and Skills to be Mastered".
+    """
+    heading = re.sub(r'\s*\(from standards\)', '', heading.strip().rstrip(':'), flags=re.IGNORECASE)
+    heading = re.sub(r'\bto master\b', 'to be Mastered', heading, flags=re.IGNORECASE)
+    return heading.rstrip(':').strip()
+
+def _split_subsections(text: str) -> Tuple[str, List[Tuple[str, str]]]:
+    parts = re.split(r'(?m)^(?=### )', text)
+    subsections = []
+    for part in parts[1:]:
+        subsections.append((canonical_heading(part.split('\n', 1)[0][len('### '):]), part))
+    return parts[0], subsections
+
+def _section_key(section_id: str) -> Tuple:
+    """Numeric sort key so that 10.1 sorts after 2.1."""
+    return tuple(int(part) if part.isdigit() else part for part in section_id.split('.'))
+
+def refresh() -> int:
+    """
+    Rescan the data directory and reload only the sections whose files changed.
+
+    Returns:
+        int: The number of sections added, reloaded or removed.
+    """
+    global _loaded
+    changes = []
+    with _lock:
+        seen = set()
+        for grade, module, section_id, file_path, stat in _scan(DATA_DIR):
+            key = (grade, section_id)
+            seen.add(key)
+            current = _corpus.get(key)
+            if current and current.path == file_path and current.mtime_ns == stat.st_mtime_ns \
+                    and current.size == stat.st_size:
+                continue
+            section = _read_section(grade, module, section_id, file_path, stat)
+            if section is not None:
+                _corpus[key] = section
+                _versions[grade] = _versions.get(grade, 0) + 1
+                changes.append((grade, section_id, section))
+        for key in [k for k in _corpus if k not in seen]:
+            del _corpus[key]
+            _versions[key[0]] = _versions.get(key[0], 0) + 1
+            changes.append((key[0], key[1], None))
+        _loaded = True
+    if changes and _watcher is not None:
+        metrics.log("notes_reloaded", sections=[f"{grade}/{section_id}" for grade, section_id, _ in changes])
+    for grade, section_id, section in changes:
+        for listener in _listeners:
+            listener(grade, section_id, section)
+    return len(changes)
+
+def load() -> int:
+    """
+    Load the whole notes corpus into memory. Safe to call again; unchanged files are not re-read.
+
+    Returns:
+        int: The number of sections loaded or reloaded.
+    """
+    return refresh()
+
+def subscribe(listener: Callable[[str, str, Optional[Section]], None]):
+    """
+    Register a callback run after each reload as listener(grade, section_id, section).
+
+    section is None when the file was removed.
+    """
+    _listeners.append(listener)
+
+def _ensure_loaded():
+    if not _loaded:
+        load()
+
+def _watch(interval: float, stop: threading.Event):
+    while not stop.wait(interval):
+        try:
+            refresh()
+        except Exception as e:
+            metrics.log("notes_refresh_error", error=repr(e))
+
+def start_watcher(interval: float = RELOAD_INTERVAL) -> threading.Event:
+    """
+    Start a background thread that polls file mtimes and hot-reloads changed sections.
+
+    Args:
+        interval (float): Seconds between rescans.
+
+    Returns:
+        threading.Event: Set it to stop the watcher.
+    """
+    global _watcher
+    stop = threading.Event()
+    _watcher = threading.Thread(target=_watch, args=(interval, stop), name="notes-watcher", daemon=True)
+    _watcher.start()
+    return stop
+
+def get_section(grade: str, section: str) -> Optional[Section]:
+    """Return the cached Section for (grade, section), or None if it does not exist."""
+    _ensure_loaded()
+    return _corpus.get((grade, section))
+
+def all_sections() -> List[Section]:
+    """Return every loaded Section."""
+    _ensure_loaded()
+    with _lock:
+        return list(_corpus.values())
+
+def grades() -> List[str]:
+    """Return the grades that have notes, e.g. ["7th", "8th"]."""
+    _ensure_loaded()
+    with _lock:
+        return sorted({grade for grade, _ in _corpus})
+
+def retrieve(grade: str, section: str, headings: Optional[List[str]] = None, max_tokens: int = 0) -> str:
     """
     Retrieve notes from a specific section.
 
     Args:
         grade (str): The grade level of the notes. Ex: 7th or 8th.
         section (str): The section to retrieve notes from. Ex: 1.1, 4.3, etc.
+        headings (Optional[List[str]]): Only return subsections whose heading contains one of these,
+            case-insensitively and ignoring spelling variants (see canonical_heading).
+            Ex: ["Section Overview", "Concepts and Skills"].
+        max_tokens (int): Approximate token budget; 0 means unlimited. Whole subsections are dropped
+            from the end to fit, and only a lone oversized subsection is cut mid-way (at a line break;
+            if not even its heading and first line fit, it is dropped).
 
     Returns:
         str: The retrieved notes.
     """
-    # Parse module and section from input (e.g., "1.1" -> module1, section1.1.txt)
-    module_num = section.split('.')[0]
-    module_folder = f"module{module_num}"
-    section_file = f"section{section}.txt"
-    file_path = os.path.join("data", grade, module_folder, section_file)
+    found = get_section(grade, section)
+    if found is None:
+        return f"Notes for section {section} not found."
+    if not headings and not max_tokens:
+        return found.text
+    subsections = found.subsections
+    if headings:
+        wanted = [canonical_heading(h).lower() for h in headings]
+        subsections = [(h, t) for h, t in subsections if any(w in h.lower() for w in wanted)]
+        if not subsections:
+            available = ", ".join(dict.fromkeys(h for h, _ in found.subsections))
+            return f"No subsections of section {section} match {headings}. Available: {available}."
+    if not max_tokens:
+        return found.header + "".join(t for _, t in subsections)
+    budget = max_tokens * CHARS_PER_TOKEN
+    parts = [found.header]
+    used = len(found.header)
+    for _, text in subsections:
+        if used + len(text) > budget:
+            if len(parts) == 1:
+                cut = text[:max(budget - used, 0)]
+                cut = cut[:cut.rfind('\n') + 1]
+                # Dropped rather than cut mid-word, or left as a heading with nothing under it.
+                if cut.strip().count('\n'):
+                    parts.append(cut)
+            break
+        parts.append(text)
+        used += len(text)
+    return "".join(parts)
 
-    print(os.getcwd(), file_path)
+def get_catalog(grade: str) -> List[Dict]:
+    """
+    Get the numerically ordered section catalog for a grade. Built once and rebuilt only after a reload.
 
-    # Check if the file exists
-    if not os.path.isfile(file_path):
-        return f"Notes for section {section} not found."
+    Args:
+        grade (str): The grade level to retrieve sections for. Ex: 7th or 8th.
+
+    Returns:
+        List[Dict]: One entry per section with grade, module, section, title and size (bytes).
+    """
+    _ensure_loaded()
+    version = _versions.get(grade, 0)
+    cached = _catalogs.get(grade)
+    if cached and cached[0] == version:
+        catalog_lookups.inc(result="hit")
+        return cached[1]
+    catalog_lookups.inc(result="miss")
+    with _lock:
+        sections = [s for (g, _), s in _corpus.items() if g == grade]
+    sections.sort(key=lambda s: _section_key(s.section_id))
+    catalog = [{
+        "grade": s.grade,
+        "module": int(s.module[len('module'):]) if s.module[len('module'):].isdigit() else s.module,
+        "section": s.section_id,
+        "title": s.title,
+        "size": s.size,
+    } for s in sections]
+    _catalogs[grade] = (version, catalog)
+    return catalog
 
-    # Read and return the content of the file
-    with open(file_path, 'r') as file:
-        return file.read()
-    
 def get_sections(grade: str) -> str:
     """
     Get all section identifiers and their titles for a specific grade.
-    
+
     Args:
         grade (str): The grade level to retrieve sections for. Ex: 7th or 8th.
 
     Returns:
         str: A string with each section_id and title on a new line.
     """
-    sections = []
-    base_path = os.path.join('data', grade)
-    # Loop through all module folders
-    for module in os.listdir(base_path):
-        module_path = os.path.join(base_path, module)
-        if os.path.isdir(module_path):
-            # Loop through all section files
-            for filename in os.listdir(module_path):
-                if filename.startswith('section') and filename.endswith('.txt'):
-                    section_id = filename.replace('section', '').replace('.txt', '')
-                    file_path = os.path.join(module_path, filename)
-                    try:
-                        with open(file_path, "r", encoding="utf-8") as f:
-                            first_line = f.readline().strip().split(': ')[1]
-                            sections.append((section_id, first_line))
-                    except Exception as e:
-                        print(f"Error reading {file_path}: {e}")
-    sections = sorted(sections, key=lambda x: x[0])
-    return "\n".join([f"{id}: {title}" for id, title in sections])
+    return "\n".join([f"{entry['section']}: {entry['title']}" for entry in get_catalog(grade)])
 
 if __name__ == "__main__":
-    print(get_sections("8th"))
\ No newline at end of file
+    print(get_sections("8th"))
@@ -0,0 +1,129 @@
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from tools import note_retriever
+
+K1 = 1.2
+B = 0.75
+SNIPPET_CHARS = 200
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "is", "it", "of", "on",
+    "or", "that", "the", "this", "to", "what", "when", "which", "with", "will", "do", "does", "i", "me",
+}
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in _STOPWORDS]
+
+class NotesIndex:
+    """Inverted index over the notes corpus with BM25 scoring. Documents are keyed by (grade, section_id)."""
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[Tuple[str, str], int]] = {}
+        self._doc_terms: Dict[Tuple[str, str], Counter] = {}
+        self._doc_length: Dict[Tuple[str, str], int] = {}
+        self._sections: Dict[Tuple[str, str], note_retriever.Section] = {}
+        self._grade_docs: Dict[str, int] = {}
+        self._grade_length: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def update(self, grade: str, section_id: str, section: Optional[note_retriever.Section]):
+        """Index, reindex or (when section is None) drop one document."""
+        key = (grade, section_id)
+        with self._lock:
+            self._remove(key)
+            if section is None:
+                return
+            terms = Counter(tokenize(section.title) * 2 + tokenize(section.text))
+            self._doc_terms[key] = terms
+            self._doc_length[key] = sum(terms.values())
+            self._sections[key] = section
+            for term, count in terms.items():
+                self._postings.setdefault(term, {})[key] = count
+            self._grade_docs[grade] = self._grade_docs.get(grade, 0) + 1
+            self._grade_length[grade] = self._grade_length.get(grade, 0) + self._doc_length[key]
+
+    def _remove(self, key: Tuple[str, str]):
+        terms = self._doc_terms.pop(key, None)
+        if terms is None:
+            return
+        del self._sections[key]
+        length = self._doc_length.pop(key)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[key]
+            if not postings:
+                del self._postings[term]
+        self._grade_docs[key[0]] -= 1
+        self._grade_length[key[0]] -= length
+
+    def search(self, grade: str, query: str, k: int = 5) -> List[Dict]:
+        """
+        Rank the sections of a grade against a free-text query.
+
+        Args:
+            grade (str): The grade level to search. Ex: 7th or 8th.
+            query (str): Free-text query.
+            k (int): Maximum number of results; below 1 returns nothing.
+
+        Returns:
+            List[Dict]: Up to k results with section, title, score and snippet, best first.
+        """
+        terms = tokenize(query)
+        with self._lock:
+            n_docs = self._grade_docs.get(grade, 0)
+            if not terms or not n_docs or k < 1:
+                return []
+            avg_length = self._grade_length[grade] / n_docs
+            scores: Dict[Tuple[str, str], float] = {}
+            for term in set(terms):
+                postings = {key: tf for key, tf in self._postings.get(term, {}).items() if key[0] == grade}
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for key, tf in postings.items():
+                    length = self._doc_length[key]
+                    scores[key] = scores.get(key, 0.0) + idf * tf * (K1 + 1) / (
+                        tf + K1 * (1 - B + B * length / avg_length))
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            sections = [self._sections[key] for key, _ in ranked]
+        return [{
+            "section": section.section_id,
+            "title": section.title,
+            "score": round(score, 4),
+            "snippet": _snippet(section.text, terms),
+        } for section, (_, score) in zip(sections, ranked)]
+
+def _snippet(text: str, terms: List[str]) -> str:
+    """Return the first body line that mentions a query term, trimmed around the match."""
+    pattern = re.compile(r"\b(" + "|".join(re.escape(t) for t in terms) + r")", re.IGNORECASE)
+    for line in text.split("\n")[1:]:
+        match = pattern.search(line)
+        if match and not line.startswith("#"):
+            start = max(0, match.start() - SNIPPET_CHARS // 4)
+            snippet = line[start:start + SNIPPET_CHARS].strip()
+            return ("..." if start else "") + snippet + ("..." if start + SNIPPET_CHARS < len(line) else "")
+    return ""
+
+index = NotesIndex()
+_built = False
+_build_lock = threading.Lock()
+
+def build():
+    """Index the whole corpus and keep the index in step with later reloads."""
+    global _built
+    with _build_lock:
+        if _built:
+            return
+        note_retriever.subscribe(index.update)
+        for section in note_retriever.all_sections():
+            index.update(section.grade, section.section_id, section)
+        _built = True
+
+def search(grade: str, query: str, k: int = 5) -> List[Dict]:
+    """See NotesIndex.search. Builds the index on first use."""
+    if not _built:
+        build()
+    return index.search(grade, query, k)
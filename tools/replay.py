@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# off: call live services. record: call them and save every exchange. replay: answer only from fixtures.
+MODES = ("off", "record", "replay")
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "replay_fixtures.jsonl")
+
+class MissingFixture(KeyError):
+    pass
+
+class ReplayedError(RuntimeError):
+    """Raised in replay mode where the live call raised while recording."""
+
+def request_key(service: str, request: Dict) -> str:
+    return hashlib.sha256(json.dumps([service, request], sort_keys=True).encode("utf-8")).hexdigest()
+
+class FixtureStore:
+    """
+    Append-only JSONL file of recorded exchanges.
+
+    The same request may be recorded several times with different responses (e.g. sampled LLM output);
+    replay hands them out in recorded order and then keeps returning the last one.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fixtures: Dict[str, List[Tuple[Dict, float]]] = {}
+        self._cursor: Dict[str, int] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._fixtures.setdefault(record["key"], []).append((record["response"], record["elapsed"]))
+
+    def record(self, service: str, request: Dict, response: Dict, elapsed: float):
+        key = request_key(service, request)
+        line = json.dumps({"key": key, "service": service, "request": request,
+                           "response": response, "elapsed": elapsed}) + "\n"
+        with self._lock:
+            self._fixtures.setdefault(key, []).append((response, elapsed))
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def lookup(self, service: str, request: Dict) -> Tuple[Dict, float]:
+        key = request_key(service, request)
+        with self._lock:
+            recorded = self._fixtures.get(key)
+            if not recorded:
+                raise MissingFixture(f"No {service} fixture for request {json.dumps(request)[:200]}")
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+            return recorded[min(index, len(recorded) - 1)]
+
+mode = os.getenv("REPLAY_MODE", "off")
+# "recorded" replays each exchange with its original latency, "zero" with none, or a fixed number of seconds.
+latency = os.getenv("REPLAY_LATENCY", "recorded")
+_store: Optional[FixtureStore] = None
+
+def configure(new_mode: Optional[str] = None, fixtures: Optional[str] = None, new_latency: Optional[str] = None):
+    """Switch mode, fixture file or replay latency at runtime (the defaults come from REPLAY_* env vars)."""
+    global mode, latency, _store
+    if new_mode is not None:
+        if new_mode not in MODES:
+            raise ValueError(f"Replay mode must be one of {MODES}, got {new_mode!r}")
+        mode = new_mode
+    if new_latency is not None:
+        latency = new_latency
+    if fixtures is not None or _store is None:
+        _store = FixtureStore(fixtures or os.getenv("REPLAY_FIXTURES", DEFAULT_FIXTURES))
+
+def store() -> FixtureStore:
+    if _store is None:
+        configure()
+    return _store
+
+def _delay(elapsed: float) -> float:
+    if latency == "recorded":
+        return elapsed
+    if latency == "zero":
+        return 0.0
+    return float(latency)
+
+def _replayed(response: Dict) -> Dict:
+    if "exception" in response:
+        raise ReplayedError(response["exception"])
+    return response
+
+def call(service: str, request: Dict, live: Callable[[], Dict]) -> Dict:
+    """
+    Run live() (which must return a JSON-serializable dict) or stand in for it, depending on the mode.
+
+    Args:
+        service (str): Name of the external service, e.g. "dify" or "gemini".
+        request (Dict): Everything that determines the response. Leave out secrets such as API keys.
+        live (Callable[[], Dict]): Performs the real call.
+
+    Returns:
+        Dict: The live or recorded response.
+    """
+    if mode == "replay":
+        response, elapsed = store().lookup(service, request)
+        time.sleep(_delay(elapsed))
+        return _replayed(response)
+    if mode != "record":
+        return live()
+    start = time.perf_counter()
+    try:
+        response = live()
+    except Exception as e:
+        store().record(service, request, {"exception": repr(e)}, time.perf_counter() - start)
+        raise
+    store().record(service, request, response, time.perf_counter() - start)
+    return response
+
+async def acall(service: str, request: Dict, live: Callable[[], Awaitable[Dict]]) -> Dict:
+    """Async version of call."""
+    if mode == "replay":
+        response, elapsed = store().lookup(service, request)
+        await asyncio.sleep(_delay(elapsed))
+        return _replayed(response)
+    if mode != "record":
+        return await live()
+    start = time.perf_counter()
+    try:
+        response = await live()
+    except Exception as e:
+        store().record(service, request, {"exception": repr(e)}, time.perf_counter() - start)
+        raise
+    store().record(service, request, response, time.perf_counter() - start)
+    return response
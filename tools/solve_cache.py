@@ -0,0 +1,150 @@
+import asyncio
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from tools import metrics
+
+_OPERATOR_SPELLINGS = [
+    ("×", "*"), ("·", "*"), ("÷", "/"), ("−", "-"), ("–", "-"), ("**", "^"),
+    ("≤", "<="), ("≥", ">="), ("≠", "!="),
+]
+_WORD_OPERATORS = [
+    (r"\bdivided by\b", "/"), (r"\bmultiplied by\b", "*"), (r"\btimes\b", "*"),
+    (r"\bplus\b", "+"), (r"\bminus\b", "-"), (r"\bequals\b", "="),
+]
+
+def normalize(problem: str) -> str:
+    """
+    Normalize a problem string so that trivially different spellings share a cache key.
+
+    Args:
+        problem (str): The raw problem text.
+
+    Returns:
+        str: Lowercased text with backticks stripped, operators unified and whitespace collapsed.
+    """
+    text = problem.strip().strip('`').lower()
+    for spelling, operator in _OPERATOR_SPELLINGS:
+        text = text.replace(spelling, operator)
+    for pattern, operator in _WORD_OPERATORS:
+        text = re.sub(pattern, operator, text)
+    text = re.sub(r"\s*([-+*/^=<>!(),])\s*", r"\1", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+class SolveCache:
+    """
+    Two-tier cache: an in-process LRU with TTL in front of an optional SQLite store.
+
+    SQLite errors (e.g. the file locked by another worker for longer than the busy timeout) are logged
+    and treated as a miss or a skipped write, so the cache degrades to memory-only instead of failing.
+    """
+
+    def __init__(self, path: Optional[str], max_entries: int = 1024, ttl: float = 3600,
+                 disk_ttl: float = 30 * 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_ttl = disk_ttl
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Separate from _lock so a slow disk statement never holds up memory lookups.
+        self._db_lock = threading.Lock()
+        self._db = None
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "disk_errors": 0}
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+                # WAL lets several server workers share one cache file.
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("CREATE TABLE IF NOT EXISTS solutions "
+                                 "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)")
+            except sqlite3.Error as e:
+                # Built at import, so a bad path must not stop the server from starting.
+                self._disk_error("open", e)
+                self._db = None
+
+    def _get_memory(self, key: str, now: float) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[1] < self.ttl:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return entry[0]
+            if entry:
+                del self._memory[key]
+            if self._db is None:
+                self.counters["misses"] += 1
+            return None
+
+    def _get_disk(self, key: str, now: float) -> Optional[str]:
+        try:
+            with self._db_lock:
+                row = self._db.execute("SELECT value, stored_at FROM solutions WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            self._disk_error("get", e)
+            row = None
+        with self._lock:
+            if row and now - row[1] < self.disk_ttl:
+                self._remember(key, row[0], now)
+                self.counters["disk_hits"] += 1
+                return row[0]
+            self.counters["misses"] += 1
+            return None
+
+    def _set_disk(self, key: str, value: str, now: float):
+        try:
+            with self._db_lock:
+                self._db.execute("INSERT OR REPLACE INTO solutions (key, value, stored_at) VALUES (?, ?, ?)",
+                                 (key, value, now))
+        except sqlite3.Error as e:
+            self._disk_error("set", e)
+
+    def _disk_error(self, operation: str, error: sqlite3.Error):
+        with self._lock:
+            self.counters["disk_errors"] += 1
+        metrics.log("solve_cache_disk_error", operation=operation, error=repr(error))
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None or self._db is None:
+            return value
+        return self._get_disk(key, now)
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self.counters["stores"] += 1
+        if self._db is not None:
+            self._set_disk(key, value, now)
+
+    async def aget(self, key: str) -> Optional[str]:
+        """Like get, but reads SQLite in a thread so a locked file never blocks the event loop."""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None or self._db is None:
+            return value
+        return await asyncio.to_thread(self._get_disk, key, now)
+
+    async def aset(self, key: str, value: str):
+        """Like set, but writes SQLite in a thread so a locked file never blocks the event loop."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self.counters["stores"] += 1
+        if self._db is not None:
+            await asyncio.to_thread(self._set_disk, key, value, now)
+
+    def _remember(self, key: str, value: str, now: float):
+        self._memory[key] = (value, now)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the current in-memory size."""
+        with self._lock:
+            return dict(self.counters, memory_entries=len(self._memory))
@@ -0,0 +1,139 @@
+import asyncio
+import csv
+import glob
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+from tools import local_solver
+from tools import math_solver
+from tools import metrics
+from tools import note_retriever
+from tools import note_search
+from tools import replay
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Comma-separated CSV files (globs allowed, relative to the repo) whose "question" column is solved at startup
+# so the answers are cached, e.g. "benchmark_data/*.csv". Empty by default: every miss costs a WolframAlpha query.
+PROBLEMS = os.getenv("WARMUP_PROBLEMS", "")
+CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "2"))
+CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", "8"))
+# Pre-solving gives up after this many seconds; the server is marked ready either way.
+PRESOLVE_TIMEOUT = float(os.getenv("WARMUP_PRESOLVE_TIMEOUT", "120"))
+
+# pending -> warming -> ready, or failed if the notes could not be loaded.
+state: Dict = {"status": "pending", "started_at": None, "seconds": None, "steps": {}}
+
+metrics.callback("warmup_ready", "1 once this worker has finished warming up.",
+                 lambda: {(): 1 if state["status"] == "ready" else 0})
+metrics.callback("warmup_step_seconds", "Time spent in each warm-up step.",
+                 lambda: {(("step", name),): step["seconds"] for name, step in list(state["steps"].items())})
+
+def ready() -> bool:
+    return state["status"] == "ready"
+
+def load_problems(patterns: str) -> List[str]:
+    """Read the unique questions from the CSV files matching the comma-separated patterns."""
+    problems = {}
+    for pattern in filter(None, (p.strip() for p in patterns.split(","))):
+        for path in sorted(glob.glob(os.path.join(ROOT, pattern))):
+            with open(path, 'r', encoding='utf-8') as file:
+                for row in csv.DictReader(file):
+                    question = (row.get("question") or "").strip()
+                    if question:
+                        problems[question] = None
+    return list(problems)
+
+async def _step(name: str, fn: Callable[[], Awaitable[Optional[Dict]]], required: bool = False) -> bool:
+    """Run and time one step. Returns False if a required step failed."""
+    state["steps"][name] = {"status": "running", "seconds": 0.0}
+    start = time.perf_counter()
+    try:
+        step = {"status": "ok", **(await fn() or {})}
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        step = {"status": "error", "error": repr(e)}
+    step["seconds"] = round(time.perf_counter() - start, 4)
+    state["steps"][name] = step
+    metrics.log("warmup_step", step=name, **step)
+    return step["status"] != "error" or not required
+
+async def _notes() -> Dict:
+    await asyncio.to_thread(note_retriever.load)
+    return {"sections": len(note_retriever.all_sections())}
+
+async def _search_index() -> None:
+    await asyncio.to_thread(note_search.build)
+
+async def _catalogs() -> Dict:
+    grades = note_retriever.grades()
+    for grade in grades:
+        note_retriever.get_catalog(grade)
+    return {"grades": grades}
+
+async def _local_solver() -> Dict:
+    if not (math_solver.LOCAL_SOLVER and local_solver.available()):
+        return {"status": "skipped"}
+    # The first sympy parse/solve imports and builds most of what later calls reuse.
+    await asyncio.to_thread(local_solver.solve, "solve 2x + 3 = 7")
+    return {}
+
+async def _upstream_pool(connections: int) -> Dict:
+    if connections <= 0:
+        return {"status": "skipped"}
+    opened = await math_solver.prime(connections)
+    if opened == 0:
+        return {"status": "skipped" if replay.mode == "replay" else "error", "connections": 0}
+    return {"connections": opened}
+
+async def _presolve(app_id: str, problems: List[str], concurrency: int, timeout: float) -> Dict:
+    if not problems:
+        return {"status": "skipped"}
+    semaphore = asyncio.Semaphore(concurrency)
+    engines: Dict[str, int] = {}
+
+    async def solve_one(problem: str):
+        async with semaphore:
+            text, engine = await math_solver.solve_with_engine(problem, app_id)
+        engine = "error" if math_solver.is_error(text) else engine
+        engines[engine] = engines.get(engine, 0) + 1
+
+    try:
+        await asyncio.wait_for(asyncio.gather(*(solve_one(p) for p in problems)), timeout)
+    except asyncio.TimeoutError:
+        return {"status": "timeout", "problems": len(problems), "engines": engines}
+    return {"problems": len(problems), "engines": engines}
+
+async def run(app_id: str, problems: Optional[List[str]] = None, connections: int = CONNECTIONS,
+              concurrency: int = CONCURRENCY, presolve_timeout: float = PRESOLVE_TIMEOUT) -> Dict:
+    """
+    Warm this worker up: load and index the notes, build the section catalogs, warm the local solver,
+    open upstream connections and optionally pre-solve common problems into the cache.
+
+    Only the notes steps are required; the others are best effort and the worker is ready once they finish.
+
+    Args:
+        app_id (str): The WolframAlpha app ID, used for pre-solving.
+        problems (Optional[List[str]]): Problems to pre-solve. Defaults to the questions in WARMUP_PROBLEMS.
+        connections (int): Upstream connections to open.
+        concurrency (int): Problems pre-solved at once.
+        presolve_timeout (float): Seconds before pre-solving is abandoned.
+
+    Returns:
+        Dict: The warm-up state, also served by the /ready and /health endpoints.
+    """
+    if problems is None:
+        problems = load_problems(PROBLEMS)
+    state.update(status="warming", started_at=time.time(), seconds=None)
+    start = time.perf_counter()
+    ok = await _step("notes", _notes, required=True) \
+        and await _step("search_index", _search_index, required=True) \
+        and await _step("catalogs", _catalogs, required=True)
+    if ok:
+        await _step("local_solver", _local_solver)
+        await _step("upstream_pool", lambda: _upstream_pool(connections))
+        await _step("presolve", lambda: _presolve(app_id, problems, concurrency, presolve_timeout))
+    state["seconds"] = round(time.perf_counter() - start, 4)
+    state["status"] = "ready" if ok else "failed"
+    metrics.log("warmup_finished", status=state["status"], seconds=state["seconds"])
+    return state